@@ -0,0 +1,328 @@
+"""
+Benchmark suites with statistical summaries.
+
+Register benchmarks, optionally over a grid of parameters, then run them:
+
+```py
+from aslib.bench import benchmark, run, save_results
+
+@benchmark(n=[10, 1000])
+def sort_ints(n):
+    sorted(range(n, 0, -1))
+
+results = run()
+save_results(results, "bench.json")
+```
+
+Each benchmark is timed with `aslib.timing.call_timer()`.  Initial samples
+that are slow while the process warms up are dropped, then outliers, and the
+remaining per-call times are summarized with `aslib.stats.get_stats()` and a
+confidence interval for the mean.
+
+Use `compare()` to flag regressions between two sets of results.
+"""
+
+#-------------------------------------------------------------------------------
+
+from   collections import namedtuple, OrderedDict
+import fnmatch
+import itertools
+import json
+import math
+from   statistics import NormalDist
+import sys
+
+from   .stats import get_stats, Stats
+from   .timing import call_timer, USEC
+
+__all__ = [
+    "Comparison",
+    "Result",
+    "Suite",
+    "benchmark",
+    "compare",
+    "format_comparisons",
+    "load_results",
+    "mean_interval",
+    "reject_outliers",
+    "run",
+    "save_results",
+    "warm_up_length",
+]
+
+#-------------------------------------------------------------------------------
+
+def warm_up_length(times):
+    """
+    Returns the number of initial samples to drop as warm-up.
+
+    Uses the MSER rule: chooses the truncation that minimizes the standard
+    error of the mean of the remaining samples, truncating at most half.
+    """
+    n = len(times)
+    best, best_d = math.inf, 0
+    # Suffix sums, for the mean and variance of each truncation.
+    total = total2 = 0.
+    suffix = []
+    for x in reversed(times):
+        total += x
+        total2 += x * x
+        suffix.append((total, total2))
+    suffix.reverse()
+    for d in range(n // 2 + 1):
+        m = n - d
+        s, s2 = suffix[d]
+        mser = (s2 - s * s / m) / (m * m)
+        if mser < best:
+            best, best_d = mser, d
+    return best_d
+
+
+def reject_outliers(times, k=1.5):
+    """
+    Returns `times` without outliers outside Tukey's fences.
+
+    @param k
+      Multiple of the interquartile range beyond the quartiles past which a
+      sample is an outlier.
+    """
+    s = sorted(times)
+    q1 = s[int(round((len(s) - 1) * 0.25))]
+    q3 = s[int(round((len(s) - 1) * 0.75))]
+    lo, hi = q1 - k * (q3 - q1), q3 + k * (q3 - q1)
+    return [ t for t in times if lo <= t <= hi ]
+
+
+def mean_interval(stats, confidence=0.95):
+    """
+    Returns a normal confidence interval for the mean from `stats`.
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    half = z * stats.std_dev / math.sqrt(stats.num) if stats.num > 1 else 0.
+    return (stats.mean - half, stats.mean + half)
+
+
+#-------------------------------------------------------------------------------
+
+Result = namedtuple(
+    "Result",
+    ("name", "params", "count", "samples", "warm_up", "outliers", "stats",
+     "ci"))
+
+Result.__doc__ = """
+Result of a benchmark.
+
+`count` is the number of calls per sample.  `samples` is the number of
+samples taken, of which `warm_up` initial samples and `outliers` others were
+dropped.  `stats` summarizes the per-call time in seconds of the remaining
+samples, and `ci` is the confidence interval for the mean.
+"""
+
+def _case_name(name, params):
+    if len(params) == 0:
+        return name
+    else:
+        return "{}[{}]".format(
+            name, ",".join( "{}={}".format(k, v) for k, v in params.items() ))
+
+
+class Suite:
+    """
+    A collection of named benchmarks.
+    """
+
+    def __init__(self):
+        self.__benchmarks = OrderedDict()
+
+
+    def add(self, name, fn, **grid):
+        """
+        Registers a benchmark.
+
+        @param grid
+          Sequences of values for keyword arguments to `fn`.  The benchmark
+          is run for each combination.
+        """
+        if name in self.__benchmarks:
+            raise ValueError("duplicate benchmark: {}".format(name))
+        grid = { k: list(v) for k, v in grid.items() }
+        self.__benchmarks[name] = fn, grid
+
+
+    def benchmark(self, name=None, **grid):
+        """
+        Decorator to register a function as a benchmark.
+
+        @param name
+          The benchmark name; defaults to the function's qualified name.
+        """
+        if callable(name):
+            # Used without arguments.
+            return self.benchmark()(name)
+
+        def register(fn):
+            self.add(fn.__qualname__ if name is None else name, fn, **grid)
+            return fn
+
+        return register
+
+
+    def cases(self, select="*"):
+        """
+        Generates `(name, fn, params)` for each benchmark and combination of
+        parameters whose name matches the glob pattern `select`.
+        """
+        for name, (fn, grid) in self.__benchmarks.items():
+            for values in itertools.product(*grid.values()):
+                params = OrderedDict(zip(grid, values))
+                case_name = _case_name(name, params)
+                if fnmatch.fnmatchcase(case_name, select):
+                    yield case_name, fn, params
+
+
+    def run(self, select="*", *, samples=100, warm_up=1,
+            min_sample_time=100 * USEC, outlier_k=1.5, confidence=0.95,
+            print=None):
+        """
+        Runs benchmarks.
+
+        @param select
+          Glob pattern of benchmark names to run.
+        @param samples
+          Number of samples to take for each benchmark.
+        @param warm_up
+          Number of untimed calls before sampling.
+        @param min_sample_time
+          Minimum time per sample; each sample makes as many calls as needed.
+        @param outlier_k
+          Tukey's fence multiple for outlier rejection, or `None` for none.
+        @param confidence
+          Confidence level for the interval of the mean.
+        @param print
+          If not `None`, function to print progress.
+        @return
+          A list of `Result`.
+        """
+        timer = call_timer(
+            samples, warm_up=warm_up, min_sample_time=min_sample_time)
+        results = []
+        for name, fn, params in self.cases(select):
+            timing = timer(fn, **params)
+            times = timing["times"]
+            # Drop warm-up samples and outliers.
+            num_warm_up = warm_up_length(times)
+            times = times[num_warm_up :]
+            kept = times if outlier_k is None else reject_outliers(
+                times, outlier_k)
+            stats = get_stats(kept)
+            result = Result(
+                name, dict(params), timing["count"], samples, num_warm_up,
+                len(times) - len(kept), stats, mean_interval(stats, confidence))
+            if print is not None:
+                print(_format_result(result))
+            results.append(result)
+        return results
+
+
+
+def _format_result(result):
+    return "{:40s} {} s  ({}/{} samples dropped)".format(
+        result.name, result.stats.mean_std,
+        result.warm_up + result.outliers, result.samples)
+
+
+#-------------------------------------------------------------------------------
+
+# The default suite.
+SUITE = Suite()
+
+benchmark   = SUITE.benchmark
+run         = SUITE.run
+
+#-------------------------------------------------------------------------------
+
+def save_results(results, path):
+    """
+    Writes `results` as JSON to `path`.
+    """
+    with open(path, "w") as file:
+        json.dump(
+            [ dict(r._asdict(), stats=r.stats._asdict()) for r in results ],
+            file, indent=1)
+
+
+def _load_stats(jso):
+    # JSON turns the tuple of (p, value) pairs into lists.
+    return Stats(**dict(
+        jso, percentiles=tuple(map(tuple, jso.get("percentiles", ())))))
+
+
+def load_results(path):
+    """
+    Reads results written by `save_results()`.
+
+    @return
+      A list of `Result`.
+    """
+    with open(path) as file:
+        jso = json.load(file)
+    return [
+        Result(**dict(r, stats=_load_stats(r["stats"]), ci=tuple(r["ci"])))
+        for r in jso
+    ]
+
+
+Comparison = namedtuple(
+    "Comparison", ("name", "old", "new", "ratio", "status"))
+
+Comparison.__doc__ = """
+Comparison of a benchmark between two runs.
+
+`ratio` is the new mean time over the old.  `status` is "regression" or
+"improvement" if the confidence intervals don't overlap and the ratio exceeds
+the threshold, "same" otherwise, or "added" or "removed" if the benchmark is
+missing in one run.
+"""
+
+def compare(old, new, *, threshold=0.05):
+    """
+    Compares two sets of benchmark results, matching them by name.
+
+    @param threshold
+      The minimum relative change in mean time to flag.
+    @return
+      A list of `Comparison`.
+    """
+    old = OrderedDict( (r.name, r) for r in old )
+    new = OrderedDict( (r.name, r) for r in new )
+    comparisons = []
+    for name in list(old) + [ n for n in new if n not in old ]:
+        o, n = old.get(name), new.get(name)
+        if o is None:
+            comparisons.append(Comparison(name, None, n, None, "added"))
+        elif n is None:
+            comparisons.append(Comparison(name, o, None, None, "removed"))
+        else:
+            ratio = n.stats.mean / o.stats.mean
+            if n.ci[0] > o.ci[1] and ratio > 1 + threshold:
+                status = "regression"
+            elif n.ci[1] < o.ci[0] and ratio < 1 / (1 + threshold):
+                status = "improvement"
+            else:
+                status = "same"
+            comparisons.append(Comparison(name, o, n, ratio, status))
+    return comparisons
+
+
+def format_comparisons(comparisons, *, file=sys.stdout):
+    """
+    Prints a table of `comparisons`.
+    """
+    for c in comparisons:
+        old = "" if c.old is None else c.old.stats.mean_std
+        new = "" if c.new is None else c.new.stats.mean_std
+        ratio = "" if c.ratio is None else "{:.3f}x".format(c.ratio)
+        print("{:40s} {:>20s} {:>20s} {:>8s}  {}".format(
+            c.name, old, new, ratio, c.status), file=file)
+
+
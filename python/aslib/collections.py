@@ -3,9 +3,28 @@ from .py import format_ctor
 #-------------------------------------------------------------------------------
 
 class BaseStruct:
+    """
+    Read-only record with fields in slots.
+
+    The fields are the slots declared by the first subclass.  Further
+    subclasses may declare additional slots, for instance to store method
+    memos; these aren't fields, so `__repr__()` and `copy()` ignore them.
+    """
+
+    # No instance dict; allow weak references, for `memoize_method(weak=True)`.
+    __slots__ = ("__weakref__", )
+
+    # Names of fields.
+    _fields = None
+
+    def __init_subclass__(cls, **kw_args):
+        super().__init_subclass__(**kw_args)
+        if cls._fields is None:
+            cls._fields = tuple(cls.__dict__.get("__slots__", ()))
+
 
     def __init__(self, **kw_args):
-        for name in self.__slots__:
+        for name in self._fields:
             super(BaseStruct, self).__setattr__(name, kw_args.pop(name, None))
         if len(kw_args) > 0:
             raise AttributeError("no attributes {}".format(", ".join(kw_args)))
@@ -13,7 +32,7 @@ class BaseStruct:
 
     def __repr__(self):
         return format_ctor(
-            self, **{ n: getattr(self, n) for n in self.__slots__ })
+            self, **{ n: getattr(self, n) for n in self._fields })
 
 
     def __setattr__(self, name, value):
@@ -21,7 +40,7 @@ class BaseStruct:
 
 
     def copy(self, **kw_args):
-        for name in self.__slots__:
+        for name in self._fields:
             kw_args.setdefault(name, getattr(self, name))
         return self.__class__(**kw_args)
 
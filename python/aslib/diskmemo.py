@@ -0,0 +1,407 @@
+"""
+Persistent memo stored on disk.
+
+Uses POSIX file locking, so is not available on all platforms.  See
+`DiskMemo`.
+"""
+
+#-------------------------------------------------------------------------------
+
+import collections.abc
+import contextlib
+import fcntl
+import mmap
+import os
+import pickle
+import struct
+import time
+
+from   .memo import digest
+
+__all__ = [
+    "DiskMemo",
+]
+
+#-------------------------------------------------------------------------------
+
+@contextlib.contextmanager
+def _flock(fd):
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while len(view) > 0:
+        view = view[os.write(fd, view) :]
+
+
+class DiskMemo(collections.abc.MutableMapping):
+    """
+    Persistent memo stored in a directory.
+
+    Stores pickled keys and values in an append-only data file.  A hash index
+    in a separate file maps key digests to records in the data file; it is
+    memory-mapped, so a lookup reads only the record it needs.  Keys are
+    identified by `digest()`, so they need not be hashable.
+
+    Several processes on one host may use the same directory concurrently.
+    Lookups take no lock.  A file lock serializes writers.  When a writer
+    grows the index or compacts the data, it replaces the files and marks the
+    old index stale, so that other processes reopen them.
+
+    If `maxbytes` is given, and the data file grows beyond it, compacts the
+    data file, keeping the most recently stored entries that fit in half of
+    `maxbytes`.  Entries dropped this way are counted in `evictions`.
+
+    Counts `hits`, `misses`, and `evictions` in this process.
+
+    ```py
+    @memoize_with(DiskMemo("/var/cache/myapp/expensive", maxbytes=1 << 30))
+    def expensive(x):
+        ...
+
+    ```
+
+    @param path
+      Path to the memo directory, which is created if necessary.
+    @param maxbytes
+      Approximate maximum size of the data file, or `None` for no limit.
+    @param capacity
+      Initial number of index slots, rounded up to a power of two.
+    """
+
+    _MAGIC          = b"aslmemo1"
+    # Magic, generation.
+    _DATA_HEADER    = struct.Struct("<8sQ")
+    # Magic, generation, capacity, count, used slots, stale flag.
+    _INDEX_HEADER   = struct.Struct("<8sQQQQQ")
+    # Hash, record offset.  A zero hash marks an empty slot, and a zero offset
+    # a deleted one.
+    _SLOT           = struct.Struct("<QQ")
+    # Key digest, key length, value length.
+    _RECORD         = struct.Struct("<16sII")
+
+    _STALE_OFFSET   = 40
+
+    def __init__(self, path, *, maxbytes=None, capacity=1024):
+        if maxbytes is not None and maxbytes < 0:
+            raise ValueError("maxbytes must be nonnegative")
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+
+        self.path = str(path)
+        self.maxbytes = maxbytes
+        self.hits = self.misses = self.evictions = 0
+
+        os.makedirs(self.path, exist_ok=True)
+        self.__data_path    = os.path.join(self.path, "data")
+        self.__index_path   = os.path.join(self.path, "index")
+        self.__lock_fd = os.open(
+            os.path.join(self.path, "lock"), os.O_RDWR | os.O_CREAT, 0o666)
+        self.__data_fd = self.__index_fd = self.__index = None
+
+        with _flock(self.__lock_fd):
+            if not os.path.exists(self.__index_path):
+                self.__write_data([])
+                self.__write_index(self.__generation, [], capacity)
+        self.__open()
+
+
+    def __repr__(self):
+        return "{}({!r}, maxbytes={!r})".format(
+            self.__class__.__name__, self.path, self.maxbytes)
+
+
+    def close(self):
+        """
+        Closes the memo's files.
+        """
+        self.__close()
+        if self.__lock_fd is not None:
+            os.close(self.__lock_fd)
+            self.__lock_fd = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    @property
+    def nbytes(self):
+        """
+        The size of the data file.
+        """
+        self.__check()
+        return os.fstat(self.__data_fd).st_size
+
+
+    # Files.
+
+    def __open(self):
+        # Another writer may replace the files between opening the data and
+        # the index; if the generations don't match, try again.
+        for _ in range(100):
+            self.__close()
+            self.__index_fd = os.open(self.__index_path, os.O_RDWR)
+            self.__index = mmap.mmap(self.__index_fd, 0)
+            self.__data_fd = os.open(self.__data_path, os.O_RDWR | os.O_APPEND)
+            magic, gen = self._DATA_HEADER.unpack(
+                os.pread(self.__data_fd, self._DATA_HEADER.size, 0))
+            if magic != self._MAGIC:
+                raise RuntimeError("not a memo data file: " + self.__data_path)
+            if gen == self.__header[1]:
+                self.__generation = gen
+                return
+            time.sleep(0.001)
+        raise RuntimeError("can't open memo: " + self.path)
+
+
+    def __close(self):
+        if self.__index is not None:
+            self.__index.close()
+            self.__index = None
+        for fd in self.__index_fd, self.__data_fd:
+            if fd is not None:
+                os.close(fd)
+        self.__index_fd = self.__data_fd = None
+
+
+    @property
+    def __header(self):
+        header = self._INDEX_HEADER.unpack_from(self.__index, 0)
+        if header[0] != self._MAGIC:
+            raise RuntimeError("not a memo index file: " + self.__index_path)
+        return header
+
+
+    def __check(self):
+        """
+        Reopens the files, if another writer has replaced them.
+        """
+        if self.__index is None:
+            raise ValueError("memo is closed")
+        if self.__header[5]:
+            self.__open()
+
+
+    def __write_data(self, records):
+        """
+        Writes a new data file containing `records`, and returns their offsets.
+        """
+        self.__generation = int.from_bytes(os.urandom(8), "little")
+        tmp_path = self.__data_path + ".tmp"
+        offsets = []
+        with open(tmp_path, "wb") as file:
+            file.write(self._DATA_HEADER.pack(self._MAGIC, self.__generation))
+            for record in records:
+                offsets.append(file.tell())
+                file.write(record)
+        os.replace(tmp_path, self.__data_path)
+        return offsets
+
+
+    def __write_index(self, gen, slots, capacity):
+        """
+        Writes a new index file for `slots`, pairs of hash and offset.
+        """
+        # Probing masks the hash, so capacity must be a power of two.
+        capacity = 1 << (capacity - 1).bit_length()
+        # Keep the load factor no more than 1/2.
+        while capacity < 2 * len(slots) + 2:
+            capacity *= 2
+        mask = capacity - 1
+        table = bytearray(self._SLOT.size * capacity)
+        for hash, offset in slots:
+            i = hash & mask
+            while self._SLOT.unpack_from(table, i * self._SLOT.size)[0] != 0:
+                i = (i + 1) & mask
+            self._SLOT.pack_into(table, i * self._SLOT.size, hash, offset)
+
+        tmp_path = self.__index_path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(self._INDEX_HEADER.pack(
+                self._MAGIC, gen, capacity, len(slots), len(slots), 0))
+            file.write(table)
+        os.replace(tmp_path, self.__index_path)
+
+
+    # Index.
+
+    def __slots(self):
+        """
+        Returns live slots as pairs of hash and offset.
+        """
+        capacity = self.__header[2]
+        return [
+            (h, o)
+            for h, o in (
+                self._SLOT.unpack_from(
+                    self.__index, self._INDEX_HEADER.size + i * self._SLOT.size)
+                for i in range(capacity)
+            )
+            if h != 0 and o != 0
+        ]
+
+
+    def __find(self, dig):
+        """
+        Looks up the slot for key digest `dig`.
+
+        @return
+          The slot position and the record offset, or the position of the
+          empty slot where it would be inserted and `None`.
+        """
+        hash = int.from_bytes(dig[: 8], "little") | 1
+        capacity = self.__header[2]
+        mask = capacity - 1
+        i = hash & mask
+        while True:
+            pos = self._INDEX_HEADER.size + i * self._SLOT.size
+            h, offset = self._SLOT.unpack_from(self.__index, pos)
+            if h == 0:
+                return pos, None
+            if h == hash and offset != 0:
+                record_dig, _, _ = self._RECORD.unpack(
+                    os.pread(self.__data_fd, self._RECORD.size, offset))
+                if record_dig == dig:
+                    return pos, offset
+            i = (i + 1) & mask
+
+
+    def __read(self, offset):
+        """
+        Returns the record at `offset` as digest, key bytes, value bytes.
+        """
+        dig, key_len, val_len = self._RECORD.unpack(
+            os.pread(self.__data_fd, self._RECORD.size, offset))
+        data = os.pread(
+            self.__data_fd, key_len + val_len, offset + self._RECORD.size)
+        return dig, data[: key_len], data[key_len :]
+
+
+    def __set_header(self, **kw_args):
+        _, gen, capacity, count, used, stale = self.__header
+        self._INDEX_HEADER.pack_into(
+            self.__index, 0, self._MAGIC, gen,
+            kw_args.get("capacity", capacity),
+            kw_args.get("count", count),
+            kw_args.get("used", used),
+            kw_args.get("stale", stale))
+
+
+    def __rewrite(self, compact):
+        """
+        Rewrites the index, and if `compact`, the data file too.
+
+        Must be called with the write lock held.
+        """
+        slots = self.__slots()
+        gen = self.__generation
+        if compact:
+            # Keep the most recently written records that fit in the budget.
+            budget = self.maxbytes // 2 - self._DATA_HEADER.size
+            kept = []
+            for hash, offset in sorted(slots, key=lambda s: -s[1]):
+                dig, key, value = self.__read(offset)
+                record = self._RECORD.pack(dig, len(key), len(value))
+                record += key + value
+                if len(record) > budget:
+                    break
+                budget -= len(record)
+                kept.append((hash, record))
+            kept.reverse()
+            self.evictions += len(slots) - len(kept)
+            offsets = self.__write_data( r for _, r in kept )
+            slots = [ (h, o) for (h, _), o in zip(kept, offsets) ]
+            gen = self.__generation
+        self.__write_index(gen, slots, self.__header[2])
+        # Tell other processes to reopen the files.
+        struct.pack_into("<Q", self.__index, self._STALE_OFFSET, 1)
+        self.__open()
+
+
+    # Mapping interface.
+
+    def __getitem__(self, key):
+        self.__check()
+        _, offset = self.__find(digest(key))
+        if offset is None:
+            self.misses += 1
+            raise KeyError(key)
+        _, _, value = self.__read(offset)
+        self.hits += 1
+        return pickle.loads(value)
+
+
+    def __setitem__(self, key, value):
+        dig = digest(key)
+        key = pickle.dumps(key, protocol=pickle.HIGHEST_PROTOCOL)
+        value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        record = self._RECORD.pack(dig, len(key), len(value)) + key + value
+
+        with _flock(self.__lock_fd):
+            self.__check()
+            _, _, capacity, count, used, _ = self.__header
+            if 2 * (used + 1) > capacity:
+                self.__rewrite(compact=False)
+
+            offset = os.fstat(self.__data_fd).st_size
+            _write_all(self.__data_fd, record)
+
+            pos, old = self.__find(dig)
+            # Write the offset before the hash, so that concurrent readers
+            # never see a matching hash with a bad offset.
+            struct.pack_into("<Q", self.__index, pos + 8, offset)
+            struct.pack_into(
+                "<Q", self.__index, pos, int.from_bytes(dig[: 8], "little") | 1)
+            if old is None:
+                _, _, _, count, used, _ = self.__header
+                self.__set_header(count=count + 1, used=used + 1)
+
+            if (self.maxbytes is not None
+                and offset + len(record) > self.maxbytes):
+                self.__rewrite(compact=True)
+
+
+    def __delitem__(self, key):
+        with _flock(self.__lock_fd):
+            self.__check()
+            pos, offset = self.__find(digest(key))
+            if offset is None:
+                raise KeyError(key)
+            struct.pack_into("<Q", self.__index, pos + 8, 0)
+            self.__set_header(count=self.__header[3] - 1)
+
+
+    def __iter__(self):
+        self.__check()
+        keys = [ self.__read(o)[1] for _, o in sorted(self.__slots()) ]
+        return ( pickle.loads(k) for k in keys )
+
+
+    def __len__(self):
+        self.__check()
+        return self.__header[3]
+
+
+    def clear(self):
+        """
+        Removes all entries.
+        """
+        with _flock(self.__lock_fd):
+            self.__check()
+            self.__write_data([])
+            self.__write_index(self.__generation, [], self.__header[2])
+            struct.pack_into("<Q", self.__index, self._STALE_OFFSET, 1)
+            self.__open()
+
+
+
@@ -5,7 +5,9 @@ Tools for working with iterators.
 #-------------------------------------------------------------------------------
 
 from   collections import deque
+import heapq
 
+from   .parallel import pmap
 from   .recipes import *  # also imports * from itertools
 
 #-------------------------------------------------------------------------------
@@ -58,6 +60,55 @@ def take_last(iterable):
     return e
 
 
+def batched(iterable, n, *, as_array=None):
+    """
+    Generates successive chunks of `n` items from `iterable`.
+
+    Unlike `grouper()`, the last chunk is shorter if items run out, rather
+    than padded.
+
+      >>> list(batched("ABCDEFG", 3))
+      [('A', 'B', 'C'), ('D', 'E', 'F'), ('G',)]
+      >>> list(batched(range(5), 2, as_array=int))
+      [array([0, 1]), array([2, 3]), array([4])]
+
+    @param as_array
+      If not `None`, a NumPy dtype; generates each chunk as an array of this
+      dtype, filled with `np.fromiter()`, rather than as a tuple.  If
+      `iterable` is itself an array of this dtype, chunks are views of it,
+      without copying.
+    """
+    if n < 1:
+        raise ValueError("n must be at least one")
+
+    if as_array is None:
+        i = iter(iterable)
+        while True:
+            chunk = tuple(islice(i, n))
+            if len(chunk) == 0:
+                return
+            yield chunk
+
+    else:
+        import numpy as np
+        dtype = np.dtype(as_array)
+
+        if isinstance(iterable, np.ndarray) and iterable.dtype == dtype:
+            # Slices of an array are already views.
+            iterable = iterable.reshape(-1)
+            for start in count(0, n):
+                if start >= len(iterable):
+                    return
+                yield iterable[start : start + n]
+
+        i = iter(iterable)
+        while True:
+            chunk = np.fromiter(islice(i, n), dtype=dtype)
+            if len(chunk) == 0:
+                return
+            yield chunk
+
+
 #-------------------------------------------------------------------------------
 
 # FIXME: Elsewhere
@@ -145,3 +196,102 @@ class PeekIter:
 
 
 
+#-------------------------------------------------------------------------------
+# Sorted streams
+
+def merge_sorted(*iterables, key=None, reverse=False):
+    """
+    Merges sorted iterables into a single sorted iterator.
+
+    Uses a heap of the current item of each iterable, so memory is
+    proportional to the number of iterables, and each item costs
+    O(log n) comparisons.  The merge is stable: equal items are generated
+    in the order of the iterables that contain them.
+
+    @param reverse
+      If true, the iterables are sorted in descending order.
+    """
+    return heapq.merge(*iterables, key=key, reverse=reverse)
+
+
+def group_sorted(iterable, key=None, *, check=False):
+    """
+    Generates `(key, group)` for each run of items with equal keys.
+
+    Like `itertools.groupby()`, each group is an iterator that shares the
+    underlying iterator, so a group is never buffered; a group must be
+    consumed before advancing to the next.
+
+    @param check
+      If true, raises `ValueError` if keys aren't in ascending order.
+    """
+    groups = groupby(iterable, key)
+    if not check:
+        yield from groups
+        return
+    for i, (k, group) in enumerate(groups):
+        if i > 0 and not prev < k:
+            raise ValueError("keys not sorted: {!r} after {!r}".format(k, prev))
+        prev = k
+        yield k, group
+
+
+def merge_join(left, right, *, key=None, how="inner", check=False):
+    """
+    Joins two iterables sorted by key.
+
+    Generates `(left_item, right_item)` pairs for items with equal keys.  For
+    an outer join, an item without a match is paired with `None`.  Items with
+    a repeated key produce all pairs of left and right items with that key;
+    only the right items with the current key are buffered.
+
+    @param key
+      Function that returns the join key of an item, applied to items on
+      both sides; by default, the items themselves.
+    @param how
+      "inner", "left", "right", or "outer".
+    @param check
+      If true, raises `ValueError` if either side isn't sorted by key.
+    """
+    if how not in ("inner", "left", "right", "outer"):
+        raise ValueError("unknown how: {}".format(how))
+    keep_left = how in ("left", "outer")
+    keep_right = how in ("right", "outer")
+    left = group_sorted(left, key, check=check)
+    right = group_sorted(right, key, check=check)
+
+    l = next(left, None)
+    r = next(right, None)
+    while l is not None and r is not None:
+        lk, litems = l
+        rk, ritems = r
+        if lk < rk:
+            if keep_left:
+                for item in litems:
+                    yield item, None
+            l = next(left, None)
+        elif rk < lk:
+            if keep_right:
+                for item in ritems:
+                    yield None, item
+            r = next(right, None)
+        else:
+            ritems = list(ritems)
+            for litem in litems:
+                for ritem in ritems:
+                    yield litem, ritem
+            l = next(left, None)
+            r = next(right, None)
+
+    if keep_left:
+        while l is not None:
+            for item in l[1]:
+                yield item, None
+            l = next(left, None)
+    if keep_right:
+        while r is not None:
+            for item in r[1]:
+                yield None, item
+            r = next(right, None)
+
+
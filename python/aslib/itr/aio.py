@@ -0,0 +1,299 @@
+"""
+Tools for working with async iterators.
+
+Async counterparts of tools in `aslib.itr`, plus tools for fan-in, prefetch,
+and rate limiting.  Functions that accept async iterables also accept
+ordinary iterables.
+"""
+
+#-------------------------------------------------------------------------------
+
+import asyncio
+from   collections import deque
+
+__all__ = [
+    "PeekIter",
+    "abuffer",
+    "amerge",
+    "arate_limit",
+    "batched",
+    "chain",
+    "first",
+    "grouper",
+    "last",
+    "roundrobin",
+    "take",
+    "to_aiter",
+]
+
+#-------------------------------------------------------------------------------
+
+async def _sync_aiter(iterable):
+    for item in iterable:
+        yield item
+
+
+def to_aiter(iterable):
+    """
+    Returns an async iterator for an async or ordinary iterable.
+    """
+    if hasattr(iterable, "__aiter__"):
+        return iterable.__aiter__()
+    else:
+        return _sync_aiter(iterable)
+
+
+async def _anext(it, default):
+    try:
+        return await it.__anext__()
+    except StopAsyncIteration:
+        return default
+
+
+_END = object()
+
+#-------------------------------------------------------------------------------
+
+async def take(n, iterable):
+    """
+    Returns the first `n` items as a list.
+    """
+    it = to_aiter(iterable)
+    items = []
+    while len(items) < n:
+        item = await _anext(it, _END)
+        if item is _END:
+            break
+        items.append(item)
+    return items
+
+
+async def chain(*iterables):
+    """
+    Generates the items of each iterable in turn.
+    """
+    for iterable in iterables:
+        async for item in to_aiter(iterable):
+            yield item
+
+
+async def batched(iterable, n):
+    """
+    Generates tuples of `n` items; the last may be shorter.
+    """
+    if n < 1:
+        raise ValueError("n must be at least one")
+    batch = []
+    async for item in to_aiter(iterable):
+        batch.append(item)
+        if len(batch) == n:
+            yield tuple(batch)
+            batch = []
+    if len(batch) > 0:
+        yield tuple(batch)
+
+
+async def grouper(iterable, n, fillvalue=None):
+    """
+    Generates tuples of `n` items, padding the last with `fillvalue`.
+    """
+    async for batch in batched(iterable, n):
+        yield batch + (fillvalue, ) * (n - len(batch))
+
+
+async def first(iterable):
+    """
+    Generates `(first, item)` for each item in `iterable`, where `first` is
+    true for the first time and false for subsequent items.
+    """
+    is_first = True
+    async for item in to_aiter(iterable):
+        yield is_first, item
+        is_first = False
+
+
+async def last(iterable):
+    """
+    Generates `(last, item)` for each item in `iterable`, where `last` is
+    false except for the last item.
+    """
+    it = to_aiter(iterable)
+    item = await _anext(it, _END)
+    if item is _END:
+        return
+    while True:
+        next_item = await _anext(it, _END)
+        if next_item is _END:
+            yield True, item
+            break
+        yield False, item
+        item = next_item
+
+
+async def roundrobin(*iterables):
+    """
+    Generates an item from each iterable in turn, skipping exhausted ones.
+    """
+    its = deque( to_aiter(i) for i in iterables )
+    while len(its) > 0:
+        it = its.popleft()
+        item = await _anext(it, _END)
+        if item is not _END:
+            yield item
+            its.append(it)
+
+
+class PeekIter:
+    """
+    Async iterator wrapper that supports arbitrary push back and peek ahead.
+    """
+
+    def __init__(self, iterable):
+        self.__iter = to_aiter(iterable)
+        self.__items = deque()
+
+
+    def __aiter__(self):
+        return self
+
+
+    async def __anext__(self):
+        try:
+            return self.__items.popleft()
+        except IndexError:
+            return await self.__iter.__anext__()
+
+
+    async def is_done(self):
+        """
+        Returns true if the iterator is exhausted.
+        """
+        if len(self.__items) > 0:
+            return False
+        item = await _anext(self.__iter, _END)
+        if item is _END:
+            return True
+        else:
+            self.__items.append(item)
+            return False
+
+
+    def push(self, item):
+        """
+        Pushes an `item` to the front of the iterator so that it is next.
+        """
+        self.__items.appendleft(item)
+
+
+    async def peek(self, ahead=0):
+        """
+        Returns a future item from the iterator, without advancing.
+
+        @param ahead
+          The number of items to peek ahead; 0 for the next item.
+        @raise StopAsyncIteration
+          The iterator ends first.
+        """
+        while len(self.__items) <= ahead:
+            self.__items.append(await self.__iter.__anext__())
+        return self.__items[ahead]
+
+
+
+#-------------------------------------------------------------------------------
+
+async def _pump(iterable, queue):
+    """
+    Puts items from `iterable` into `queue`, followed by `_END`, or by an
+    exception raised by `iterable`.
+    """
+    try:
+        async for item in to_aiter(iterable):
+            await queue.put((item, None))
+    except Exception as exc:
+        await queue.put((_END, exc))
+    else:
+        await queue.put((_END, None))
+
+
+async def _cancel(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def amerge(*iterables, maxsize=0):
+    """
+    Generates items from several async iterables as they become available.
+
+    Each iterable is consumed in its own task.  If one raises an exception,
+    the others are cancelled and the exception is raised.
+
+    @param maxsize
+      Maximum number of items buffered, in total; 0 for no limit.
+    """
+    queue = asyncio.Queue(maxsize)
+    tasks = [ asyncio.ensure_future(_pump(i, queue)) for i in iterables ]
+    active = len(tasks)
+    try:
+        while active > 0:
+            item, exc = await queue.get()
+            if exc is not None:
+                raise exc
+            elif item is _END:
+                active -= 1
+            else:
+                yield item
+    finally:
+        await _cancel(tasks)
+
+
+async def abuffer(iterable, n):
+    """
+    Prefetches up to `n` items from `iterable` in a separate task.
+
+    Lets a slow consumer overlap with a slow producer, such as one waiting on
+    I/O, while bounding memory.
+    """
+    if n < 1:
+        raise ValueError("n must be at least one")
+    queue = asyncio.Queue(n)
+    task = asyncio.ensure_future(_pump(iterable, queue))
+    try:
+        while True:
+            item, exc = await queue.get()
+            if exc is not None:
+                raise exc
+            elif item is _END:
+                break
+            else:
+                yield item
+    finally:
+        await _cancel([task])
+
+
+async def arate_limit(iterable, rate, *, burst=1):
+    """
+    Generates items from `iterable`, no faster than `rate` per second.
+
+    Uses a token bucket: up to `burst` items may be generated at once after
+    a pause, after which items are spaced `1 / rate` seconds apart.
+    """
+    if not rate > 0 or burst < 1:
+        raise ValueError("rate and burst must be positive")
+    loop = asyncio.get_running_loop()
+    tokens = burst
+    last = loop.time()
+    async for item in to_aiter(iterable):
+        now = loop.time()
+        tokens = min(burst, tokens + (now - last) * rate)
+        last = now
+        if tokens < 1:
+            await asyncio.sleep((1 - tokens) / rate)
+            now = loop.time()
+            tokens = min(burst, tokens + (now - last) * rate)
+            last = now
+        tokens -= 1
+        yield item
+
+
@@ -0,0 +1,122 @@
+"""
+Parallel map over iterables.
+"""
+
+#-------------------------------------------------------------------------------
+
+from   collections import deque
+import concurrent.futures
+from   itertools import islice
+import os
+
+__all__ = [
+    "pmap",
+]
+
+#-------------------------------------------------------------------------------
+
+def _apply(fn, chunk):
+    return [ fn(item) for item in chunk ]
+
+
+def _chunks(iterable, size):
+    i = iter(iterable)
+    while True:
+        chunk = list(islice(i, size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def pmap(fn, iterable, *, workers=None, mode="thread", ordered=True,
+         prefetch=None, chunksize=None, executor=None):
+    """
+    Generates `fn(item)` for each item in `iterable`, computed in parallel.
+
+    Consumes `iterable` lazily, keeping at most `prefetch` items submitted
+    but not yet generated, so `iterable` may be unbounded.  Items are sent to
+    workers in chunks, to amortize the cost of pickling for processes.
+
+    An exception raised by `fn` is raised when its result would be generated.
+    If the consumer stops iterating, or on an exception, pending work is
+    cancelled and the pool shut down.
+
+      >>> for page in pmap(fetch, urls, workers=8):
+      ...     process(page)
+
+    @param workers
+      Number of workers; by default, the number of CPUs.
+    @param mode
+      "thread" or "process".  For processes, `fn` and items must be picklable.
+    @param ordered
+      If true, generates results in input order.  Otherwise, generates them
+      as they complete, which avoids waiting behind a slow item.
+    @param prefetch
+      Maximum number of items in flight; by default, two chunks per worker.
+    @param chunksize
+      Number of items per task; by default, 1 for threads and 16 for
+      processes.
+    @param executor
+      An existing `concurrent.futures.Executor` to use instead of creating a
+      pool; it is not shut down.  `workers` and `mode` are ignored.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = 16 if mode == "process" else 1
+    if prefetch is None:
+        prefetch = 2 * workers * chunksize
+    if workers < 1 or chunksize < 1 or prefetch < 1:
+        raise ValueError("workers, chunksize, and prefetch must be positive")
+
+    if executor is not None:
+        make_executor = None
+    elif mode == "thread":
+        make_executor = lambda: concurrent.futures.ThreadPoolExecutor(workers)
+    elif mode == "process":
+        make_executor = lambda: concurrent.futures.ProcessPoolExecutor(workers)
+    else:
+        raise ValueError("unknown mode: {}".format(mode))
+
+    return _pmap(
+        fn, _chunks(iterable, chunksize), executor, make_executor, ordered,
+        max(1, prefetch // chunksize))
+
+
+def _pmap(fn, chunks, executor, make_executor, ordered, max_pending):
+    # Create the pool only once iteration starts, so that it is shut down.
+    if make_executor is not None:
+        executor = make_executor()
+    # Submitted futures; a deque in order, or a set if unordered.
+    pending = deque() if ordered else set()
+    add = pending.append if ordered else pending.add
+
+    def fill():
+        while len(pending) < max_pending:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            add(executor.submit(_apply, fn, chunk))
+
+    try:
+        fill()
+        while len(pending) > 0:
+            if ordered:
+                done = (pending.popleft(), )
+            else:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                pending.difference_update(done)
+            for future in done:
+                results = future.result()
+                # Submit more work before handing results to the consumer.
+                fill()
+                yield from results
+
+    finally:
+        for future in pending:
+            future.cancel()
+        if make_executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
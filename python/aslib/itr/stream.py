@@ -0,0 +1,297 @@
+"""
+Lazy stream pipelines.
+
+A `Stream` builds a pipeline of stages over a source iterable, which runs
+lazily as the stream is iterated.
+
+```py
+from aslib.itr.stream import Stream
+
+result = (
+    Stream(records, profile=True)
+    .map(parse)
+    .filter(is_valid)
+    .batch(1000)
+    .pmap(load, workers=4)
+    .collect()
+)
+```
+
+Adjacent `map()` and `filter()` stages are fused into a single generator, so
+a long chain of them costs one generator frame per item, not one per stage.
+With `profile=True`, each stage counts its items and measures its time, and
+`explain()` prints the plan with these.
+"""
+
+#-------------------------------------------------------------------------------
+
+from   itertools import chain, islice
+import sys
+from   time import perf_counter
+
+from   . import batched
+from   .parallel import pmap
+
+__all__ = [
+    "Stream",
+]
+
+#-------------------------------------------------------------------------------
+
+def _name(fn):
+    return getattr(fn, "__qualname__", None) or repr(fn)
+
+
+class _Stage:
+    """
+    A stage in a stream pipeline.
+
+    Counts items generated and measures time spent in the stage, when
+    profiling.
+    """
+
+    # True for stages that can be fused.
+    fusable = False
+
+    def __init__(self, description, apply=None):
+        self.description = description
+        self.__apply = apply
+        self.count = 0
+        self.time = 0.
+
+
+    def __call__(self, iterable):
+        return self.__apply(iterable)
+
+
+
+class _MapStage(_Stage):
+
+    fusable = True
+
+    def __init__(self, kind, fn):
+        super().__init__("{}({})".format(kind, _name(fn)))
+        self.kind = kind
+        self.fn = fn
+
+
+
+def _fuse(stages, profile):
+    """
+    Compiles a sequence of map and filter stages into one generator function.
+    """
+    names = {}
+    lines = []
+    indent = "            " if profile else "        "
+    for i, stage in enumerate(stages):
+        names["_f{}".format(i)] = stage.fn
+        if profile:
+            lines.append("_t = _clock()")
+            call = "_f{}(_x)".format(i)
+            if stage.kind == "map":
+                lines.append("_x = " + call)
+            else:
+                lines.append("_ok = " + call)
+            lines.append("_time[{}] += _clock() - _t".format(i))
+            if stage.kind == "filter":
+                lines.append("if not _ok: continue")
+            lines.append("_count[{}] += 1".format(i))
+        elif stage.kind == "map":
+            lines.append("_x = _f{}(_x)".format(i))
+        else:
+            lines.append("if not _f{}(_x): continue".format(i))
+    lines.append("yield _x")
+    body = "".join( indent + l + "\n" for l in lines )
+
+    if profile:
+        source = (
+            "def _fused(_it, _stages, _clock):\n"
+            "    _count = [0] * len(_stages)\n"
+            "    _time = [0.] * len(_stages)\n"
+            "    try:\n"
+            "        for _x in _it:\n"
+            + body +
+            "    finally:\n"
+            "        for _s, _n, _t in zip(_stages, _count, _time):\n"
+            "            _s.count += _n\n"
+            "            _s.time += _t\n"
+        )
+    else:
+        source = (
+            "def _fused(_it):\n"
+            "    for _x in _it:\n"
+            + body
+        )
+    exec(compile(source, "<fused stream stages>", "exec"), names)
+    fused = names["_fused"]
+    if profile:
+        return lambda it: fused(it, stages, perf_counter)
+    else:
+        return fused
+
+
+def _timed(iterable, stage, upstream):
+    """
+    Generates items from `iterable`, charging time spent getting them, less
+    the time charged upstream, to `stage`.
+    """
+    clock = perf_counter
+    it = iter(iterable)
+    start = sum( s.time for s in upstream )
+    count = 0
+    elapsed = 0.
+    try:
+        while True:
+            t = clock()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                elapsed += clock() - t
+            count += 1
+            yield item
+    finally:
+        stage.count += count
+        stage.time += elapsed - (sum( s.time for s in upstream ) - start)
+
+
+class Stream:
+    """
+    Lazy pipeline of stages over an iterable.
+
+    Each method that adds a stage returns a new stream.  Iterating a stream
+    consumes its source, so it may be iterated only once, unless the source
+    is a reusable iterable such as a list.
+
+    @param source
+      The source iterable.
+    @param profile
+      If true, counts items and measures time in each stage.
+    """
+
+    def __init__(self, source, *, profile=False):
+        self.__source = source
+        self.__stages = []
+        self.profile = bool(profile)
+
+
+    def __then(self, stage):
+        stream = self.__class__(self.__source, profile=self.profile)
+        stream.__stages = self.__stages + [stage]
+        return stream
+
+
+    def map(self, fn):
+        """
+        Applies `fn` to each item.
+        """
+        return self.__then(_MapStage("map", fn))
+
+
+    def filter(self, pred):
+        """
+        Keeps items for which `pred` is true.
+        """
+        return self.__then(_MapStage("filter", pred))
+
+
+    def take(self, n):
+        """
+        Keeps at most the first `n` items.
+        """
+        return self.__then(_Stage(
+            "take({})".format(n), lambda it: islice(it, n)))
+
+
+    def batch(self, n, *, as_array=None):
+        """
+        Groups items into chunks of `n`; see `aslib.itr.batched()`.
+        """
+        return self.__then(_Stage(
+            "batch({})".format(n),
+            lambda it: batched(it, n, as_array=as_array)))
+
+
+    def flatten(self):
+        """
+        Generates the items of each item, for instance to undo `batch()`.
+        """
+        return self.__then(_Stage("flatten()", chain.from_iterable))
+
+
+    def pmap(self, fn, **kw_args):
+        """
+        Applies `fn` to each item in parallel; see `aslib.itr.pmap()`.
+        """
+        return self.__then(_Stage(
+            "pmap({})".format(_name(fn)),
+            lambda it: pmap(fn, it, **kw_args)))
+
+
+    def __plan(self):
+        """
+        Returns the stages, with runs of fusable stages grouped into lists.
+        """
+        plan = []
+        for stage in self.__stages:
+            if stage.fusable:
+                if len(plan) > 0 and isinstance(plan[-1], list):
+                    plan[-1].append(stage)
+                else:
+                    plan.append([stage])
+            else:
+                plan.append(stage)
+        return plan
+
+
+    def __iter__(self):
+        it = self.__source
+        upstream = []
+        for step in self.__plan():
+            if isinstance(step, list):
+                it = _fuse(step, self.profile)(it)
+                upstream.extend(step)
+            else:
+                it = step(it)
+                if self.profile:
+                    it = _timed(it, step, list(upstream))
+                upstream.append(step)
+        return iter(it)
+
+
+    def collect(self):
+        """
+        Runs the pipeline and returns a list of the results.
+        """
+        return list(self)
+
+
+    def count(self):
+        """
+        Runs the pipeline and returns the number of results.
+        """
+        return sum( 1 for _ in self )
+
+
+    def explain(self, file=sys.stdout):
+        """
+        Prints the stage plan, with counts and times if profiling.
+        """
+        print("source {}".format(type(self.__source).__name__), file=file)
+        for i, step in enumerate(self.__plan()):
+            stages = step if isinstance(step, list) else [step]
+            for j, stage in enumerate(stages):
+                line = "{:>2s} {:1s} {:32s}".format(
+                    str(i) if j == 0 else "",
+                    "*" if isinstance(step, list) else "",
+                    stage.description)
+                if self.profile:
+                    line += " {:>12d} items {:12.3f} ms".format(
+                        stage.count, stage.time * 1e3)
+                print(line.rstrip(), file=file)
+        if any( isinstance(s, list) for s in self.__plan() ):
+            print("* fused", file=file)
+
+
+
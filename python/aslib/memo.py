@@ -4,49 +4,1268 @@ Memoizers.
 
 #-------------------------------------------------------------------------------
 
+import asyncio
+from   collections import namedtuple, OrderedDict
+import collections.abc
 import functools
+import hashlib
+import inspect
+import pickle
+import struct
+import sys
+import threading
+import time
+from   time import perf_counter
+import weakref
 
 __all__ = [
+    "BoundedMemo",
+    "CacheInfo",
+    "LFUMemo",
+    "LRUMemo",
+    "SingleFlight",
+    "TTLMemo",
+    "clear_all",
+    "clear_memo",
+    "digest",
+    "get_cache_infos",
     "memoize",
     "memoize_method",
+    "memoize_vectorized",
     "memoize_with",
+    "report",
+    "signature_key",
 ]
 
 #-------------------------------------------------------------------------------
 
-def memoize_with(memo):
-    def memoize(fn):
-        @functools.wraps(fn)
-        def memoized(*args, **kw_args):
-            # FIXME: It would be better to bind to the signature first, to pick
-            # up default arguments.
-            key = args + tuple(sorted(kw_args.items()))
+def _sizeof(key, value):
+    """
+    Returns the approximate size in bytes of a memo entry.
+    """
+    return sys.getsizeof(key) + sys.getsizeof(value)
+
+
+class BoundedMemo(collections.abc.MutableMapping):
+    """
+    Base class for memo mappings with size limits and eviction.
+
+    Evicts entries when the number of entries exceeds `maxsize`, or when the
+    approximate total size of entries exceeds `maxbytes`.  Subclasses choose
+    which entry to evict.  If `ttl` is given, entries also expire that many
+    seconds after they were stored.  A new entry is never evicted to make room
+    for itself; an entry larger than `maxbytes` on its own is not stored.
+
+    Counts `hits`, `misses`, `evictions`, and `expirations`.  A lookup of an
+    absent or expired key is a miss.
+
+    @param maxsize
+      The maximum number of entries, or `None` for no limit.
+    @param maxbytes
+      The maximum approximate size in bytes of all entries, or `None` for no
+      limit.
+    @param ttl
+      Time to live in seconds of each entry, or `None` for no expiry.
+    @param sizeof
+      Function that takes a key and value and returns the approximate size
+      of the entry in bytes.
+    @param clock
+      Function that returns the current time in seconds.
+    """
+
+    def __init__(self, maxsize=None, *, maxbytes=None, ttl=None,
+                 sizeof=_sizeof, clock=time.monotonic):
+        if maxsize is not None and maxsize < 1:
+            raise ValueError("maxsize must be positive")
+        if maxbytes is not None and maxbytes < 0:
+            raise ValueError("maxbytes must be nonnegative")
+        if ttl is not None and not ttl > 0:
+            raise ValueError("ttl must be positive")
+
+        self.maxsize        = maxsize
+        self.maxbytes       = maxbytes
+        self.ttl            = ttl
+        self.__sizeof       = sizeof
+        self.__clock        = clock
+
+        self._data          = self._make_data()
+        self.__sizes        = None if maxbytes is None else {}
+        self.__expiry       = None if ttl is None else {}
+        self.nbytes         = 0
+
+        self.hits           = 0
+        self.misses         = 0
+        self.evictions      = 0
+        self.expirations    = 0
+
+
+    def __repr__(self):
+        return "{}(maxsize={!r}, maxbytes={!r}, ttl={!r})".format(
+            self.__class__.__name__, self.maxsize, self.maxbytes, self.ttl)
+
+
+    # Subclass interface.
+
+    def _make_data(self):
+        """
+        Returns an empty mapping to hold entries.
+        """
+        return {}
+
+
+    def _on_insert(self, key):
+        """
+        Called after a new `key` is inserted.
+        """
+
+
+    def _on_access(self, key):
+        """
+        Called when an existing `key` is looked up or replaced.
+        """
+
+
+    def _on_remove(self, key):
+        """
+        Called after `key` is removed.
+        """
+
+
+    def _victim(self):
+        """
+        Returns the key of the entry to evict next.
+        """
+        raise NotImplementedError("_victim")
+
+
+    # Internals.
+
+    def __is_expired(self, key):
+        return (
+            self.__expiry is not None
+            and self.__expiry[key] <= self.__clock()
+        )
+
+
+    def __remove(self, key):
+        del self._data[key]
+        if self.__sizes is not None:
+            self.nbytes -= self.__sizes.pop(key)
+        if self.__expiry is not None:
+            del self.__expiry[key]
+        self._on_remove(key)
+
+
+    def __evict(self):
+        while len(self._data) > 0 and (
+                (self.maxsize is not None and len(self._data) > self.maxsize)
+             or (self.maxbytes is not None and self.nbytes > self.maxbytes)):
+            self.__remove(self._victim())
+            self.evictions += 1
+
+
+    def __make_room(self, size):
+        """
+        Evicts entries to make room for a new entry of `size` bytes.
+
+        Called before the new entry is inserted, so that it is never chosen
+        as the victim.
+        """
+        while len(self._data) > 0 and (
+                (self.maxsize is not None and len(self._data) >= self.maxsize)
+             or (self.maxbytes is not None
+                 and self.nbytes + size > self.maxbytes)):
+            self.__remove(self._victim())
+            self.evictions += 1
+
+
+    # Mapping interface.
+
+    def __getitem__(self, key):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        if self.__is_expired(key):
+            self.__remove(key)
+            self.expirations += 1
+            self.misses += 1
+            raise KeyError(key)
+        self._on_access(key)
+        self.hits += 1
+        return value
+
+
+    def __setitem__(self, key, value):
+        size = None if self.__sizes is None else self.__sizeof(key, value)
+        if key in self._data:
+            self._data[key] = value
+            if size is not None:
+                self.nbytes += size - self.__sizes[key]
+                self.__sizes[key] = size
+            self._on_access(key)
+        elif size is not None and size > self.maxbytes:
+            # The entry alone doesn't fit; don't store it.
+            self.evictions += 1
+            return
+        else:
+            self.__make_room(0 if size is None else size)
+            self._data[key] = value
+            if size is not None:
+                self.__sizes[key] = size
+                self.nbytes += size
+            self._on_insert(key)
+        if self.__expiry is not None:
+            self.__expiry[key] = self.__clock() + self.ttl
+        self.__evict()
+
+
+    def __delitem__(self, key):
+        self.__remove(key)
+
+
+    def __contains__(self, key):
+        return key in self._data and not self.__is_expired(key)
+
+
+    def __iter__(self):
+        return iter(list(self._data))
+
+
+    def __len__(self):
+        return len(self._data)
+
+
+    def clear(self):
+        """
+        Removes all entries.  Does not reset counters.
+        """
+        for key in list(self._data):
+            self.__remove(key)
+
+
+    def expire(self):
+        """
+        Removes all expired entries.
+
+        Expired entries are otherwise removed only when they are looked up.
+        """
+        if self.__expiry is not None:
+            now = self.__clock()
+            for key in [ k for k, t in self.__expiry.items() if t <= now ]:
+                self.__remove(key)
+                self.expirations += 1
+
+
+
+class LRUMemo(BoundedMemo):
+    """
+    Memo that evicts the least recently used entry.
+
+    See `BoundedMemo` for arguments.
+    """
+
+    def _make_data(self):
+        return OrderedDict()
+
+
+    def _on_access(self, key):
+        self._data.move_to_end(key)
+
+
+    def _victim(self):
+        return next(iter(self._data))
+
+
+
+class LFUMemo(BoundedMemo):
+    """
+    Memo that evicts the least frequently used entry.
+
+    Among entries with the same use count, evicts the least recently used.
+    See `BoundedMemo` for arguments.
+    """
+
+    def __init__(self, *args, **kw_args):
+        # Use count for each key.
+        self.__counts = {}
+        # Keys, in order of use, for each use count.
+        self.__buckets = {}
+        self.__min_count = 0
+        super().__init__(*args, **kw_args)
+
+
+    def __add(self, key, count):
+        self.__counts[key] = count
+        self.__buckets.setdefault(count, OrderedDict())[key] = None
+
+
+    def __discard(self, key):
+        count = self.__counts.pop(key)
+        bucket = self.__buckets[count]
+        del bucket[key]
+        if len(bucket) == 0:
+            del self.__buckets[count]
+        return count
+
+
+    def _on_insert(self, key):
+        self.__add(key, 1)
+        self.__min_count = 1
+
+
+    def _on_access(self, key):
+        count = self.__discard(key)
+        self.__add(key, count + 1)
+        if count == self.__min_count and count not in self.__buckets:
+            self.__min_count = count + 1
+
+
+    def _on_remove(self, key):
+        self.__discard(key)
+
+
+    def _victim(self):
+        if self.__min_count not in self.__buckets:
+            self.__min_count = min(self.__buckets)
+        return next(iter(self.__buckets[self.__min_count]))
+
+
+
+class TTLMemo(LRUMemo):
+    """
+    Memo whose entries expire `ttl` seconds after they are stored.
+
+    Also evicts the least recently used entry, if `maxsize` or `maxbytes` is
+    given.  See `BoundedMemo` for arguments.
+    """
+
+    def __init__(self, ttl, maxsize=None, **kw_args):
+        super().__init__(maxsize, ttl=ttl, **kw_args)
+
+
+
+#-------------------------------------------------------------------------------
+
+def _update_digest(hash, obj):
+    numpy = sys.modules.get("numpy")
+    if numpy is not None and isinstance(obj, (numpy.ndarray, numpy.generic)):
+        # Take the shape first; ascontiguousarray makes 0-d arrays 1-d.
+        tag = b"S" if isinstance(obj, numpy.generic) else b"A"
+        obj = numpy.asarray(obj)
+        hash.update(tag + obj.dtype.str.encode() + repr(obj.shape).encode())
+        obj = numpy.ascontiguousarray(obj)
+        if obj.dtype.kind == "O":
+            # The bytes are object pointers; digest the objects instead.
+            for item in obj.ravel().tolist():
+                _update_digest(hash, item)
+        else:
+            hash.update(obj.tobytes())
+        return
+
+    # Tag with the type, so that equal values of different types differ.
+    hash.update(type(obj).__qualname__.encode() + b":")
+    if obj is None or isinstance(obj, (bool, int, float, complex)):
+        hash.update(repr(obj).encode())
+    elif isinstance(obj, str):
+        hash.update(obj.encode("utf-8", "surrogatepass"))
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        hash.update(bytes(obj))
+    elif isinstance(obj, (list, tuple)):
+        hash.update(struct.pack("<Q", len(obj)))
+        for item in obj:
+            _update_digest(hash, item)
+    elif isinstance(obj, collections.abc.Mapping):
+        # Order by key digest, so that insertion order doesn't matter.
+        items = sorted( (digest(k), v) for k, v in obj.items() )
+        hash.update(struct.pack("<Q", len(items)))
+        for key, value in items:
+            hash.update(key)
+            _update_digest(hash, value)
+    elif isinstance(obj, (set, frozenset)):
+        items = sorted( digest(i) for i in obj )
+        hash.update(struct.pack("<Q", len(items)))
+        for item in items:
+            hash.update(item)
+    else:
+        hash.update(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def digest(obj):
+    """
+    Returns a stable, hashable digest of `obj`.
+
+    Handles unhashable objects, including lists, dicts, sets, and NumPy arrays,
+    by content.  The digest depends only on the content, and not on object
+    identity or the process, so it is suitable as a memo key.  Objects of other
+    types are digested by their pickle.
+
+      >>> digest([1, 2, 3]) == digest([1, 2, 3])
+      True
+      >>> digest({"x": 1, "y": 2}) == digest({"y": 2, "x": 1})
+      True
+
+    Use with `arg_keys` to memoize a function with unhashable arguments:
+
+    ```py
+    @memoize(arg_keys={"values": digest})
+    def f(values, scale=1):
+        ...
+
+    ```
+
+    @rtype
+      `bytes`
+    """
+    hash = hashlib.blake2b(digest_size=16)
+    _update_digest(hash, obj)
+    return hash.digest()
+
+
+def _raw_key(*args, **kw_args):
+    return args + tuple(sorted(kw_args.items()))
+
+
+def signature_key(fn, arg_keys=None, *, skip=0):
+    """
+    Returns a key function that binds arguments to the signature of `fn`.
+
+    The key function takes the same arguments as `fn`, and returns a tuple of
+    the value bound to each parameter, with defaults applied.  Thus, calls
+    that differ only in whether arguments are passed by position or name, or
+    whether a default is given explicitly, produce the same key.
+
+      >>> def f(x, y=2):
+      ...     pass
+      ...
+      >>> key = signature_key(f)
+      >>> key(1) == key(x=1) == key(1, y=2) == key(1, 2)
+      True
+
+    The signature is inspected once.  Calls with positional arguments only
+    bypass `inspect.Signature.bind()`, if `fn` has no variable arguments.
+
+    @param arg_keys
+      Mapping from parameter name to a function that converts the argument to
+      a key, for example `digest()` for unhashable arguments.  Also applies to
+      default values.
+    @param skip
+      Number of leading parameters to omit from the signature; 1 for `self`
+      of a method.
+    """
+    P = inspect.Parameter
+    params = list(inspect.signature(fn).parameters.values())[skip :]
+    sig = inspect.Signature(params)
+    arg_keys = {} if arg_keys is None else dict(arg_keys)
+    for name in arg_keys:
+        if name not in sig.parameters:
+            raise TypeError(
+                "{} has no parameter {}".format(fn.__qualname__, name))
+    convs = [ arg_keys.get(p.name) for p in params ]
+
+    def key(*args, **kw_args):
+        bound = sig.bind(*args, **kw_args)
+        bound.apply_defaults()
+        arguments = bound.arguments
+        key = []
+        for param, conv in zip(params, convs):
+            value = arguments[param.name]
+            if conv is not None:
+                value = conv(value)
+            elif param.kind is P.VAR_KEYWORD:
+                value = tuple(sorted(value.items()))
+            key.append(value)
+        return tuple(key)
+
+    # Precompile a fast path for positional calls, if the signature has no
+    # variable arguments and all keyword-only parameters have defaults.
+    pos = [
+        p for p in params
+        if p.kind in (P.POSITIONAL_ONLY, P.POSITIONAL_OR_KEYWORD)
+    ]
+    kw_only = [ p for p in params if p.kind is P.KEYWORD_ONLY ]
+    if (
+            len(pos) + len(kw_only) < len(params)
+         or any( p.default is P.empty for p in kw_only )
+    ):
+        return key
+
+    def default(param, conv):
+        return param.default if conv is None else conv(param.default)
+
+    kw_tail = tuple(
+        default(p, c) for p, c in zip(params, convs) if p in kw_only )
+    # For each number of positional arguments, the remainder of the key, or
+    # `None` if a parameter without a default would be missing.
+    tails = tuple(
+        None if any( p.default is P.empty for p in pos[n :] )
+        else tuple( default(p, c) for p, c in zip(pos[n :], convs[n :]) )
+             + kw_tail
+        for n in range(len(pos) + 1)
+    )
+    pos_convs = tuple(
+        (i, c) for i, c in enumerate(convs[: len(pos)]) if c is not None )
+    num_tails = len(tails)
+
+    if len(pos_convs) == 0:
+        def fast_key(*args, **kw_args):
+            if not kw_args and len(args) < num_tails:
+                tail = tails[len(args)]
+                if tail is not None:
+                    return args + tail
+            return key(*args, **kw_args)
+
+    else:
+        def fast_key(*args, **kw_args):
+            if not kw_args and len(args) < num_tails:
+                tail = tails[len(args)]
+                if tail is not None:
+                    args = list(args)
+                    for i, conv in pos_convs:
+                        if i < len(args):
+                            args[i] = conv(args[i])
+                    return tuple(args) + tail
+            return key(*args, **kw_args)
+
+    return fast_key
+
+
+def _get_key(fn, key, bind, arg_keys, skip=0):
+    """
+    Returns the key function for memoizing `fn`.
+    """
+    if key is not None:
+        if bind or arg_keys is not None:
+            raise TypeError("key is exclusive with bind and arg_keys")
+        return key
+    elif bind or arg_keys is not None:
+        return signature_key(fn, arg_keys, skip=skip)
+    else:
+        return _raw_key
+
+
+#-------------------------------------------------------------------------------
+
+def __getattr__(name):
+    # DiskMemo moved to its own module, which isn't portable; import it only
+    # on demand.
+    if name == "DiskMemo":
+        from .diskmemo import DiskMemo
+        return DiskMemo
+    raise AttributeError("module {!r} has no attribute {!r}".format(
+        __name__, name))
+
+
+#-------------------------------------------------------------------------------
+# Registry and statistics
+
+CacheInfo = namedtuple(
+    "CacheInfo",
+    ("name", "hits", "misses", "entries", "nbytes", "compute_time",
+     "time_saved"))
+
+CacheInfo.__doc__ = """
+Statistics for a memoized function.
+
+`entries` and `nbytes` are `None` if the memos can't be enumerated.
+`compute_time` is the total time spent computing values on misses, and
+`time_saved` an estimate of the time hits saved, based on the mean time of
+misses.
+"""
+
+class _CacheStats:
+    """
+    Hit, miss, and timing counts for a memoized function.
+    """
+
+    __slots__ = ("hits", "misses", "compute_time")
+
+    def __init__(self):
+        self.reset()
+
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+        self.compute_time = 0.0
+
+
+
+# All memoized functions.
+_registry = weakref.WeakSet()
+
+def _deep_sizeof(obj):
+    """
+    Estimates the size in bytes of `obj` and the objects it contains.
+
+    Walks builtin containers and instance dicts, counting each object once.
+    """
+    seen = set()
+    size = 0
+    stack = [obj]
+    while len(stack) > 0:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+            stack.append(obj.__dict__)
+    return size
+
+
+def _memo_nbytes(memo):
+    # Only a DiskMemo if its module has been imported.
+    diskmemo = sys.modules.get(__package__ + ".diskmemo")
+    if diskmemo is not None and isinstance(memo, diskmemo.DiskMemo):
+        return memo.nbytes
+    elif isinstance(memo, BoundedMemo):
+        # Don't look up entries, which would count as hits.
+        return _deep_sizeof(memo._data)
+    else:
+        return _deep_sizeof(memo)
+
+
+def _enroll(memoized, stats, get_memos, clear):
+    """
+    Adds cache introspection to `memoized` and registers it.
+
+    @param get_memos
+      Function that returns the memos in use, or `None` if they can't be
+      enumerated.
+    @param clear
+      Function that clears the memos; may do nothing, if the memo can't be
+      cleared.
+    """
+    name = memoized.__module__ + "." + memoized.__qualname__
+
+    def cache_info(*, nbytes=True):
+        """
+        Returns a `CacheInfo` for this function.
+
+        @param nbytes
+          If false, doesn't estimate the memo size, which may be slow.
+        """
+        memos = get_memos()
+        if memos is None:
+            entries = size = None
+        else:
+            try:
+                entries = sum( len(m) for m in memos )
+            except TypeError:
+                # The memo doesn't support len().
+                entries = None
+            size = sum( _memo_nbytes(m) for m in memos ) if nbytes else None
+        saved = (
+            stats.hits * stats.compute_time / stats.misses
+            if stats.misses > 0
+            else 0.
+        )
+        return CacheInfo(
+            name, stats.hits, stats.misses, entries, size, stats.compute_time,
+            saved)
+
+    def cache_clear():
+        """
+        Clears the memo and statistics for this function.
+        """
+        clear()
+        stats.reset()
+
+    memoized.cache_info = cache_info
+    memoized.cache_clear = cache_clear
+    _registry.add(memoized)
+
+
+def get_cache_infos(*, nbytes=True):
+    """
+    Returns a `CacheInfo` for each memoized function.
+    """
+    infos = ( f.cache_info(nbytes=nbytes) for f in list(_registry) )
+    return sorted(infos, key=lambda i: i.name)
+
+
+def clear_all():
+    """
+    Clears memos and statistics for all memoized functions.
+    """
+    for fn in list(_registry):
+        fn.cache_clear()
+
+
+def _format_bytes(nbytes):
+    if nbytes < 1024:
+        return "{} B".format(nbytes)
+    for unit in ("KiB", "MiB", "GiB"):
+        nbytes /= 1024
+        if nbytes < 1024:
+            break
+    return "{:.1f} {}".format(nbytes, unit)
+
+
+def report(*, file=sys.stdout, sort="nbytes"):
+    """
+    Prints a table of statistics for all memoized functions.
+
+    @param sort
+      The `CacheInfo` field by which to sort, descending.
+    """
+    infos = get_cache_infos()
+    infos.sort(key=lambda i: getattr(i, sort) or 0, reverse=True)
+
+    header = ("function", "hits", "misses", "hit rate", "entries", "size",
+              "computing", "saved")
+    rows = [
+        (
+            i.name,
+            str(i.hits),
+            str(i.misses),
+            "{:.1%}".format(i.hits / (i.hits + i.misses))
+                if i.hits + i.misses > 0 else "",
+            "" if i.entries is None else str(i.entries),
+            "" if i.nbytes is None else _format_bytes(i.nbytes),
+            "{:.3f} s".format(i.compute_time),
+            "{:.3f} s".format(i.time_saved),
+        )
+        for i in infos
+    ]
+    widths = [ max( len(r[c]) for r in [header] + rows ) for c in range(8) ]
+
+    def fmt(row):
+        return "  ".join(
+            v.ljust(w) if c == 0 else v.rjust(w)
+            for c, (v, w) in enumerate(zip(row, widths))
+        ).rstrip()
+
+    print(fmt(header), file=file)
+    print("  ".join( "-" * w for w in widths ), file=file)
+    for row in rows:
+        print(fmt(row), file=file)
+
+
+#-------------------------------------------------------------------------------
+
+class _Flight:
+    """
+    A computation of a memo value in progress.
+    """
+
+    def __init__(self):
+        self.thread = threading.get_ident()
+        self.done = threading.Event()
+        self.value = self.exc = None
+
+
+    def wait(self):
+        if self.thread == threading.get_ident():
+            raise RecursionError("memoized function called itself recursively")
+        self.done.wait()
+        if self.exc is None:
+            return self.value
+        else:
+            raise self.exc
+
+
+
+class SingleFlight:
+    """
+    Thread-safe access to a memo, with deduplication of concurrent misses.
+
+    When several threads miss the same key concurrently, exactly one calls the
+    function; the others wait for and share its result.  If the function
+    raises, the exception is raised in every waiting thread, nothing is
+    stored in the memo, and none of these calls count as hits or misses.
+
+    A single lock serializes access to the memo, but is not held while the
+    function runs, so misses on different keys compute in parallel.
+
+    Counts `computes`, the number of function calls; `waits`, the number of
+    calls that waited for another thread's computation; and `contentions`,
+    the number of times the lock was already held by another thread.
+    """
+
+    def __init__(self, memo, *, _stats=None):
+        self.memo = memo
+        self.__stats = _CacheStats() if _stats is None else _stats
+        self.__lock = threading.Lock()
+        self.__flights = {}
+
+        self.computes       = 0
+        self.waits          = 0
+        self.contentions    = 0
+
+
+    def __acquire(self):
+        if not self.__lock.acquire(blocking=False):
+            self.__lock.acquire()
+            self.contentions += 1
+
+
+    def call(self, key, fn, args, kw_args):
+        """
+        Returns the memo value for `key`, computing it as `fn(*args,
+        **kw_args)` if necessary.
+        """
+        memo = self.memo
+        stats = self.__stats
+
+        self.__acquire()
+        try:
             try:
-                return memo[key]
+                value = memo[key]
             except KeyError:
-                value = memo[key] = fn(*args, **kw_args)
+                pass
+            else:
+                stats.hits += 1
+                return value
+            flight = self.__flights.get(key)
+            if flight is None:
+                flight = self.__flights[key] = _Flight()
+                leader = True
+            else:
+                self.waits += 1
+                leader = False
+        finally:
+            self.__lock.release()
+
+        if not leader:
+            value = flight.wait()
+            # Sharing another thread's result counts as a hit, but only once
+            # it has succeeded.
+            self.__acquire()
+            try:
+                stats.hits += 1
+            finally:
+                self.__lock.release()
+            return value
+
+        start = perf_counter()
+        try:
+            value = fn(*args, **kw_args)
+        except BaseException as exc:
+            flight.exc = exc
+            self.__acquire()
+            try:
+                del self.__flights[key]
+                self.computes += 1
+            finally:
+                self.__lock.release()
+            flight.done.set()
+            raise
+
+        flight.value = value
+        elapsed = perf_counter() - start
+        self.__acquire()
+        try:
+            memo[key] = value
+            del self.__flights[key]
+            self.computes += 1
+            stats.misses += 1
+            stats.compute_time += elapsed
+        finally:
+            self.__lock.release()
+        flight.done.set()
+        return value
+
+
+
+def _finish_task(memo, stats, tasks, key, task_key, start, task):
+    del tasks[task_key]
+    # Memoize only successful results; a failed task is simply dropped, so
+    # the next call tries again.
+    if not task.cancelled() and task.exception() is None:
+        memo[key] = task.result()
+        stats.misses += 1
+        stats.compute_time += perf_counter() - start
+
+
+async def _await_memo(memo, stats, tasks, key, task_key, fn, args, kw_args):
+    """
+    Returns the memo value for `key`, awaiting `fn(*args, **kw_args)` if
+    necessary.
+
+    Tracks the in-flight task for each key in `tasks`, so that concurrent
+    awaiters of the same key share a single task.  Shields the task, so that
+    cancelling one awaiter doesn't cancel it for the others.
+    """
+    try:
+        value = memo[key]
+    except KeyError:
+        pass
+    else:
+        stats.hits += 1
+        return value
+    task = tasks.get(task_key)
+    if task is None:
+        task = tasks[task_key] = asyncio.ensure_future(fn(*args, **kw_args))
+        # Done callbacks run in order, so the memo is updated before any
+        # awaiter resumes.
+        task.add_done_callback(functools.partial(
+            _finish_task, memo, stats, tasks, key, task_key, perf_counter()))
+        return await asyncio.shield(task)
+    else:
+        value = await asyncio.shield(task)
+        # Sharing another awaiter's result counts as a hit, once it succeeds.
+        stats.hits += 1
+        return value
+
+
+def memoize_with(memo, *, key=None, bind=False, arg_keys=None,
+                 threadsafe=False):
+    """
+    Memoizes with `memo`, which may be any mutable mapping.
+
+    By default, the memo key is the positional arguments followed by the
+    sorted keyword arguments, so that `f(1)` and `f(x=1)` are memoized
+    separately.
+
+    If the function is a coroutine function, memoizes the awaited result
+    rather than the coroutine.  Concurrent awaiters of the same key share one
+    task, which is stored in `__tasks__` on the memoized function until it
+    completes.  If the task fails, nothing is memoized.
+
+    The memoized function has `cache_info()` and `cache_clear()` methods, and
+    is registered for `get_cache_infos()` and `report()`.
+
+    @param key
+      Function that takes the arguments of the memoized function and returns
+      the memo key.
+    @param bind
+      If true, binds arguments to the function's signature to build the key;
+      see `signature_key()`.
+    @param arg_keys
+      Mapping from parameter name to a function that converts the argument to
+      a key; implies `bind`.  See `signature_key()`.
+    @param threadsafe
+      If true, serializes access to the memo, and deduplicates concurrent
+      misses of the same key, so that only one thread calls the function.
+      The `SingleFlight` is stored in `__flight__` on the memoized function.
+      Not supported for coroutine functions.
+    """
+    def memoize(fn):
+        get_key = _get_key(fn, key, bind, arg_keys)
+        stats = _CacheStats()
+
+        if inspect.iscoroutinefunction(fn):
+            if threadsafe:
+                raise TypeError("threadsafe with coroutine function")
+            tasks = {}
+
+            @functools.wraps(fn)
+            async def memoized(*args, **kw_args):
+                key = get_key(*args, **kw_args)
+                return await _await_memo(
+                    memo, stats, tasks, key, key, fn, args, kw_args)
+
+            memoized.__tasks__ = tasks
+
+        elif threadsafe:
+            flight = SingleFlight(memo, _stats=stats)
+            call = flight.call
+
+            @functools.wraps(fn)
+            def memoized(*args, **kw_args):
+                return call(get_key(*args, **kw_args), fn, args, kw_args)
+
+            memoized.__flight__ = flight
+
+        else:
+            @functools.wraps(fn)
+            def memoized(*args, **kw_args):
+                key = get_key(*args, **kw_args)
+                try:
+                    value = memo[key]
+                except KeyError:
+                    start = perf_counter()
+                    value = memo[key] = fn(*args, **kw_args)
+                    stats.compute_time += perf_counter() - start
+                    stats.misses += 1
+                else:
+                    stats.hits += 1
                 return value
 
         memoized.__memo__ = memo
+        _enroll(
+            memoized, stats, lambda: [memo],
+            getattr(memo, "clear", lambda: None))
         return memoized
 
     return memoize
 
 
-def memoize(fn):
+def _make_memo(maxsize=None, *, maxbytes=None, ttl=None, policy="lru"):
+    """
+    Returns a new empty memo for the given limits and eviction policy.
+    """
+    if maxsize is None and maxbytes is None and ttl is None:
+        return {}
+    elif policy == "lru":
+        return LRUMemo(maxsize, maxbytes=maxbytes, ttl=ttl)
+    elif policy == "lfu":
+        return LFUMemo(maxsize, maxbytes=maxbytes, ttl=ttl)
+    else:
+        raise ValueError("unknown eviction policy: {}".format(policy))
+
+
+def memoize(fn=None, *, maxsize=None, maxbytes=None, ttl=None, policy="lru",
+            **kw_args):
+    """
+    Memoizes with a new empty memo.
+
+    Without arguments, memoizes with a new empty `dict`.  If any limit is
+    given, uses a bounded memo; see `BoundedMemo`.  Other keyword arguments
+    are passed to `memoize_with()`.
+
+    ```py
+    @memoize
+    def f(x):
+        ...
+
+    @memoize(maxsize=1000, ttl=60)
+    def g(x):
+        ...
+
+    ```
+
+    @param policy
+      Eviction policy for a bounded memo: "lru" or "lfu".
+    """
+    make_memo = functools.partial(
+        _make_memo, maxsize, maxbytes=maxbytes, ttl=ttl, policy=policy)
+    # Check arguments now.
+    make_memo()
+
+    memoize = lambda fn: memoize_with(make_memo(), **kw_args)(fn)
+    return memoize if fn is None else memoize(fn)
+
+
+# One NaN object for all NaN keys.  NaN is not equal to itself, but a dict
+# compares keys by identity first, so lookups of this object hit.
+_NAN = float("nan")
+
+def _vectorized_key(value):
+    return _NAN if isinstance(value, float) and value != value else value
+
+
+def memoize_vectorized(fn=None, *, memo=None, **kw_args):
+    """
+    Memoizes a vectorized function elementwise over an array argument.
+
+    The function takes an array of values as its first argument, and returns
+    an array of the same length with the result for each value.  The memoized
+    function accepts an array of any shape.  It finds the unique values, calls
+    the function once with a 1-D array of those not already in the memo, and
+    scatters the results back to the shape of the argument.
+
+    ```py
+    @memoize_vectorized
+    def f(x):
+        return np.array([ slow_scalar_f(v) for v in x ])
+
+    ```
+
+    The memo is keyed by each value, as a Python scalar, followed by any
+    other arguments.  All NaN values share one key.  Hits and misses count
+    unique values.
+
+    @param memo
+      The memo to use, or `None` for a new one.  Other keyword arguments
+      give limits for a new memo, as for `memoize()`.
     """
-    Memoizes with a new empty `dict`.
+    if memo is None:
+        memo = _make_memo(**kw_args)
+    elif len(kw_args) > 0:
+        raise TypeError("memo is exclusive with memo limits")
+
+    def memoize(fn):
+        stats = _CacheStats()
+
+        @functools.wraps(fn)
+        def memoized(values, *args, **kw_args):
+            import numpy as np
+
+            values = np.asarray(values)
+            rest = _raw_key(*args, **kw_args)
+            unique, inverse = np.unique(values, return_inverse=True)
+
+            keys = [ _vectorized_key(v) for v in unique.tolist() ]
+            results = [None] * len(unique)
+            missing = []
+            for i, key in enumerate(keys):
+                try:
+                    results[i] = memo[(key, ) + rest]
+                except KeyError:
+                    missing.append(i)
+            stats.hits += len(unique) - len(missing)
+
+            if len(missing) > 0:
+                start = perf_counter()
+                computed = fn(unique[missing], *args, **kw_args)
+                stats.compute_time += perf_counter() - start
+                stats.misses += len(missing)
+                if len(computed) != len(missing):
+                    raise ValueError(
+                        "{} returned {} results for {} values".format(
+                            fn.__name__, len(computed), len(missing)))
+                for i, result in zip(missing, computed):
+                    results[i] = memo[(keys[i], ) + rest] = result
+
+            results = np.asarray(results)
+            return results[inverse.ravel()].reshape(
+                values.shape + results.shape[1 :])
+
+        memoized.__memo__ = memo
+        _enroll(
+            memoized, stats, lambda: [memo],
+            getattr(memo, "clear", lambda: None))
+        return memoized
+
+    return memoize if fn is None else memoize(fn)
+
+
+class _DictStorage:
+    """
+    Stores each instance's memo in its `__dict__`.
+    """
+
+    def __init__(self, name, make_memo):
+        self.name = name
+        self.make_memo = make_memo
+
+
+    def get(self, obj):
+        try:
+            return obj.__dict__[self.name]
+        except KeyError:
+            return obj.__dict__.setdefault(self.name, self.make_memo())
+
+
+    def clear(self, obj):
+        obj.__dict__.pop(self.name, None)
+
+
+    def memos(self):
+        # Instances aren't tracked.
+        return None
+
+
+    def clear_all(self):
+        pass
+
+
+
+class _WeakStorage:
     """
-    return memoize_with({})(fn)
+    Stores memos in a table keyed by instance id, with weak references to the
+    instances to remove their memos when they are collected.
 
+    Unlike a `WeakKeyDictionary`, doesn't rely on instances' `__eq__` and
+    `__hash__`.  Instances must support weak references.
 
-def memoize_method(fn):
+    If `maxinstances` is not `None`, keeps memos for at most this many
+    instances, discarding the least recently used.
+    """
+
+    def __init__(self, make_memo, maxinstances=None):
+        self.make_memo = make_memo
+        self.maxinstances = maxinstances
+        # Map from id to weak reference and memo, least recently used first.
+        self.__memos = OrderedDict()
+
+
+    def get(self, obj):
+        i = id(obj)
+        memos = self.__memos
+        try:
+            ref, memo = memos[i]
+        except KeyError:
+            pass
+        else:
+            if ref() is obj:
+                if self.maxinstances is not None:
+                    memos.move_to_end(i)
+                return memo
+        memo = self.make_memo()
+
+        def remove(ref):
+            # The id may since have been reused by another instance.
+            entry = memos.get(i)
+            if entry is not None and entry[0] is ref:
+                del memos[i]
+
+        memos[i] = weakref.ref(obj, remove), memo
+        memos.move_to_end(i)
+        if self.maxinstances is not None:
+            while len(memos) > self.maxinstances:
+                memos.popitem(last=False)
+        return memo
+
+
+    def clear(self, obj):
+        self.__memos.pop(id(obj), None)
+
+
+    def memos(self):
+        return [ m for _, m in list(self.__memos.values()) ]
+
+
+    def clear_all(self):
+        self.__memos.clear()
+
+
+    def __len__(self):
+        return len(self.__memos)
+
+
+
+class _SlotStorage:
+    """
+    Stores each instance's memo in a declared slot.
+    """
+
+    def __init__(self, slot, make_memo):
+        self.slot = slot
+        self.make_memo = make_memo
+
+
+    def get(self, obj):
+        memo = getattr(obj, self.slot, None)
+        if memo is None:
+            memo = self.make_memo()
+            # Bypass `__setattr__`, in case the class is read-only.
+            object.__setattr__(obj, self.slot, memo)
+        return memo
+
+
+    def clear(self, obj):
+        if getattr(obj, self.slot, None) is not None:
+            object.__setattr__(obj, self.slot, None)
+
+
+    def memos(self):
+        # Instances aren't tracked.
+        return None
+
+
+    def clear_all(self):
+        pass
+
+
+
+def memoize_method(fn=None, *, key=None, bind=False, arg_keys=None,
+                   weak=False, slot=None, maxsize=None, maxinstances=None):
     """
     Memoizes an ordinary method.
 
-    Uses a memo dictionary attached as an attribute to each instance of the
-    containing class.  The attribute name is stored in `__memo_name__` on the
-    method function.
+    By default, uses a memo dictionary attached as an attribute to each
+    instance of the containing class.  The attribute name is stored in
+    `__memo_name__` on the method function.
 
     ```py
     class C:
@@ -57,21 +1276,121 @@ def memoize_method(fn):
             return result
 
     ```
+
+    For classes whose instances have no `__dict__`, such as classes with
+    `__slots__`, use `weak` or `slot` instead.
+
+    ```py
+    class D:
+
+        __slots__ = ("x", "_expensive_memo")
+
+        @memoize_method(slot="_expensive_memo", maxsize=16)
+        def expensive(self, arg):
+            # ...
+            return result
+
+    ```
+
+    Use `clear_memo()` to clear an instance's memo.  The memoized method has
+    `cache_info()` and `cache_clear()` methods, as with `memoize_with()`, but
+    these report entries and clear memos only with `weak` storage.
+
+    See `memoize_with()` for `key`, `bind`, and `arg_keys`; these apply to
+    arguments other than `self`.  Coroutine methods are memoized as in
+    `memoize_with()`.
+
+    @param weak
+      If true, stores memos in a table owned by the method, rather than in
+      the instances.  Instances must support weak references.
+    @param slot
+      If not `None`, the name of a slot or attribute in which to store each
+      instance's memo.  The class must declare it.  For an
+      `aslib.collections.Struct`, declare it in a subclass, so that it isn't
+      a field, and isn't copied by `copy()`.
+    @param maxsize
+      If not `None`, the maximum number of entries in each instance's memo;
+      see `LRUMemo`.
+    @param maxinstances
+      If not `None`, with `weak`, the maximum number of instances whose memos
+      are kept; memos of the least recently used instances are discarded.
+      With `maxsize`, this bounds the total number of entries.
     """
-    name = "__" + fn.__name__
-    @functools.wraps(fn)
-    def memoized(self, *args, **kw_args):
-        # FIXME: Bind to signature first.
-        key = args + tuple(sorted(kw_args.items()))
-        memo = self.__dict__.setdefault(name, {})
-        try:
-            return memo[key]
-        except KeyError:
-            value = memo[key] = fn(self, *args, **kw_args)
+    if fn is None:
+        return functools.partial(
+            memoize_method, key=key, bind=bind, arg_keys=arg_keys, weak=weak,
+            slot=slot, maxsize=maxsize, maxinstances=maxinstances)
+
+    make_memo = dict if maxsize is None else functools.partial(LRUMemo, maxsize)
+    if weak and slot is not None:
+        raise TypeError("weak is exclusive with slot")
+    elif maxinstances is not None and not weak:
+        raise TypeError("maxinstances requires weak")
+    elif weak:
+        storage = _WeakStorage(make_memo, maxinstances)
+    elif slot is not None:
+        storage = _SlotStorage(slot, make_memo)
+    else:
+        name = "__" + fn.__name__
+        storage = _DictStorage(name, make_memo)
+    get_memo = storage.get
+    get_key = _get_key(fn, key, bind, arg_keys, skip=1)
+    stats = _CacheStats()
+
+    if inspect.iscoroutinefunction(fn):
+        tasks = {}
+
+        @functools.wraps(fn)
+        async def memoized(self, *args, **kw_args):
+            key = get_key(*args, **kw_args)
+            memo = get_memo(self)
+            # The instance is referenced by the task's arguments while it is
+            # in flight, so its id is unique.
+            return await _await_memo(
+                memo, stats, tasks, key, (id(self), key), fn, (self, ) + args,
+                kw_args)
+
+    else:
+        @functools.wraps(fn)
+        def memoized(self, *args, **kw_args):
+            key = get_key(*args, **kw_args)
+            memo = get_memo(self)
+            try:
+                value = memo[key]
+            except KeyError:
+                start = perf_counter()
+                value = memo[key] = fn(self, *args, **kw_args)
+                stats.compute_time += perf_counter() - start
+                stats.misses += 1
+            else:
+                stats.hits += 1
             return value
 
-    memoized.__memo_name__ = name
+    if isinstance(storage, _DictStorage):
+        memoized.__memo_name__ = name
+    memoized.__memo_storage__ = storage
+    _enroll(memoized, stats, storage.memos, storage.clear_all)
     return memoized
 
 
+def clear_memo(obj, method=None):
+    """
+    Clears memos of `obj`'s methods memoized with `memoize_method()`.
+
+    @param method
+      The name of the memoized method to clear, or `None` for all.
+    """
+    if method is None:
+        methods = {
+            n: m
+            for c in reversed(type(obj).__mro__)
+            for n, m in vars(c).items()
+        }.values()
+    else:
+        methods = [getattr(type(obj), method)]
+    for method in methods:
+        storage = getattr(method, "__memo_storage__", None)
+        if storage is not None:
+            storage.clear(obj)
+
 
@@ -0,0 +1,292 @@
+"""
+In-process metrics: counters, gauges, and histograms.
+
+Metrics are registered by name in a `Registry`, which can write them in
+Prometheus text format or as JSON lines.
+
+```py
+from aslib import metrics
+
+metrics.counter("requests").inc()
+metrics.histogram("db.load").observe(0.0123)
+metrics.dump("/var/run/myapp/metrics.prom")
+```
+"""
+
+#-------------------------------------------------------------------------------
+
+import bisect
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "REGISTRY",
+    "Registry",
+    "counter",
+    "dump",
+    "gauge",
+    "histogram",
+]
+
+#-------------------------------------------------------------------------------
+
+class Counter:
+    """
+    A monotonically increasing count.
+    """
+
+    type = "counter"
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.__lock = threading.Lock()
+
+
+    def __repr__(self):
+        return "{}({!r}, value={!r})".format(
+            self.__class__.__name__, self.name, self.value)
+
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError("counter can't decrease")
+        with self.__lock:
+            self.value += amount
+
+
+    def to_jso(self):
+        return {"name": self.name, "type": self.type, "value": self.value}
+
+
+
+class Gauge:
+    """
+    A value that may go up and down.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.__lock = threading.Lock()
+
+
+    def __repr__(self):
+        return "{}({!r}, value={!r})".format(
+            self.__class__.__name__, self.name, self.value)
+
+
+    def set(self, value):
+        self.value = value
+
+
+    def inc(self, amount=1):
+        with self.__lock:
+            self.value += amount
+
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+    def to_jso(self):
+        return {"name": self.name, "type": self.type, "value": self.value}
+
+
+
+class Histogram:
+    """
+    Counts of observations in fixed buckets on a log scale.
+
+    Bucket upper bounds are `low * factor ** i` for `i` from 0 up to the first
+    bound no less than `high`; a final bucket counts observations above that.
+    The defaults suit durations in seconds, from 1 µs to about 100 s.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, help="", *, low=1e-6, high=100., factor=2.):
+        if not (0 < low < high and factor > 1):
+            raise ValueError("invalid bucket parameters")
+        self.name = name
+        self.help = help
+        num = int(math.ceil(math.log(high / low, factor))) + 1
+        self.bounds = tuple( low * factor ** i for i in range(num) )
+        self.counts = [0] * (num + 1)
+        self.sum = 0.
+        self.count = 0
+        self.__lock = threading.Lock()
+
+
+    def __repr__(self):
+        return "{}({!r}, count={!r}, sum={!r})".format(
+            self.__class__.__name__, self.name, self.count, self.sum)
+
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self.__lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+    def to_jso(self):
+        return {
+            "name"      : self.name,
+            "type"      : self.type,
+            "bounds"    : list(self.bounds),
+            "counts"    : list(self.counts),
+            "sum"       : self.sum,
+            "count"     : self.count,
+        }
+
+
+
+#-------------------------------------------------------------------------------
+
+_PROMETHEUS_INVALID = re.compile(r"[^a-zA-Z0-9_:]")
+
+def _prometheus_name(name):
+    name = _PROMETHEUS_INVALID.sub("_", name)
+    return "_" + name if name[: 1].isdigit() else name
+
+
+class Registry:
+    """
+    Metrics by name.
+    """
+
+    def __init__(self):
+        self.__metrics = {}
+        self.__lock = threading.Lock()
+
+
+    def __get(self, cls, name, help, **kw_args):
+        try:
+            metric = self.__metrics[name]
+        except KeyError:
+            with self.__lock:
+                metric = self.__metrics.get(name)
+                if metric is None:
+                    metric = self.__metrics[name] = cls(name, help, **kw_args)
+        if not isinstance(metric, cls):
+            raise TypeError("metric {} is a {}".format(name, metric.type))
+        return metric
+
+
+    def counter(self, name, help=""):
+        """
+        Returns the counter `name`, creating it if necessary.
+        """
+        return self.__get(Counter, name, help)
+
+
+    def gauge(self, name, help=""):
+        """
+        Returns the gauge `name`, creating it if necessary.
+        """
+        return self.__get(Gauge, name, help)
+
+
+    def histogram(self, name, help="", **kw_args):
+        """
+        Returns the histogram `name`, creating it if necessary.
+
+        Keyword arguments specify buckets for a new histogram; see
+        `Histogram`.
+        """
+        return self.__get(Histogram, name, help, **kw_args)
+
+
+    def __iter__(self):
+        with self.__lock:
+            metrics = list(self.__metrics.values())
+        return iter(sorted(metrics, key=lambda m: m.name))
+
+
+    def clear(self):
+        """
+        Removes all metrics.
+        """
+        with self.__lock:
+            self.__metrics.clear()
+
+
+    def write_prometheus(self, file=sys.stdout):
+        """
+        Writes all metrics in Prometheus text exposition format.
+        """
+        for metric in self:
+            name = _prometheus_name(metric.name)
+            if metric.help:
+                print("# HELP {} {}".format(name, metric.help), file=file)
+            print("# TYPE {} {}".format(name, metric.type), file=file)
+            if isinstance(metric, Histogram):
+                total = 0
+                for bound, count in zip(metric.bounds, metric.counts):
+                    total += count
+                    print("{}_bucket{{le=\"{!r}\"}} {}".format(
+                        name, bound, total), file=file)
+                print("{}_bucket{{le=\"+Inf\"}} {}".format(
+                    name, metric.count), file=file)
+                print("{}_sum {!r}".format(name, metric.sum), file=file)
+                print("{}_count {}".format(name, metric.count), file=file)
+            else:
+                print("{} {!r}".format(name, metric.value), file=file)
+
+
+    def write_json_lines(self, file=sys.stdout):
+        """
+        Writes all metrics as JSON objects, one per line, with a timestamp.
+        """
+        now = time.time()
+        for metric in self:
+            print(json.dumps(dict(metric.to_jso(), time=now)), file=file)
+
+
+    def dump(self, path, *, format="prometheus"):
+        """
+        Writes all metrics to a file.
+
+        Replaces a Prometheus file atomically, so that a scraper never reads
+        a partial file.  Appends JSON lines.
+
+        @param format
+          "prometheus" or "json".
+        """
+        if format == "prometheus":
+            tmp_path = "{}.{}.tmp".format(path, os.getpid())
+            with open(tmp_path, "w") as file:
+                self.write_prometheus(file)
+            os.replace(tmp_path, path)
+        elif format == "json":
+            with open(path, "a") as file:
+                self.write_json_lines(file)
+        else:
+            raise ValueError("unknown format: {}".format(format))
+
+
+
+#-------------------------------------------------------------------------------
+
+# The default registry.
+REGISTRY = Registry()
+
+counter     = REGISTRY.counter
+gauge       = REGISTRY.gauge
+histogram   = REGISTRY.histogram
+dump        = REGISTRY.dump
+
@@ -14,3 +14,34 @@ def get_data_size(df):
     )
 
 
+
+
+def group_stats(values, by, weights=None, *, ddof=1, percentiles=()):
+    """
+    Computes summary statistics of a series, grouped by keys.
+
+    See `aslib.stats.group_stats()`.
+
+      >>> group_stats(df.latency, df.endpoint, percentiles=(0.99, ))
+
+    @param values
+      A series, or array, of values.
+    @param by
+      A series, or array, of group keys.
+    @param weights
+      A series, or array, of weights, or none.
+    @return
+      A dataframe indexed by group key, with a column for each `Stats` field
+      and a `pct_*` column for each additional percentile.
+    """
+    from ..stats import _group_stats
+
+    keys, fields, pcts = _group_stats(
+        values, by, weights, ddof=ddof, percentiles=percentiles)
+    index = pd.Index(keys, name=getattr(by, "name", None))
+    df = pd.DataFrame(fields, index=index)
+    for p, col in zip(percentiles, pcts):
+        df["pct_{:g}".format(100 * p)] = col
+    return df
+
+
@@ -1,16 +1,30 @@
 from   collections import namedtuple
 import math
+from   statistics import NormalDist
+import struct
+import time
+import zlib
 
 import numpy as np
 
+from   .terminal import chart
+
 #-------------------------------------------------------------------------------
 
 Stats = namedtuple(
     "Stats",
-    ("num", "min", "pct_5", "mean", "median", "pct_95", "max", "std_dev"))
+    ("num", "min", "pct_5", "mean", "median", "pct_95", "max", "std_dev",
+     "percentiles"),
+    defaults=((), ))
 
 
 class Stats(Stats):
+    """
+    Summary statistics.
+
+    `percentiles` is a tuple of `(p, value)` pairs for additional requested
+    percentiles, where `p` is between 0 and 1.
+    """
 
     @property
     def mean_std(self):
@@ -21,35 +35,1144 @@ class Stats(Stats):
         )
 
 
+    def percentile(self, p):
+        """
+        Returns the `p` percentile, where `p` is between 0 and 1.
+
+        @raise KeyError
+          The percentile wasn't computed.
+        """
+        for q, value in self.percentiles:
+            if q == p:
+                return value
+        try:
+            return getattr(self, _PCT_FIELDS[p])
+        except KeyError:
+            raise KeyError("percentile not computed: {}".format(p)) from None
+
+
     def __str__(self):
-        values = [ format(getattr(self, f), ".6f") for f in self._fields ]
+        fields = [ f for f in self._fields if f != "percentiles" ]
+        values = [ format(getattr(self, f), ".6f") for f in fields ]
         values[0] = str(self.num)
+        for p, value in self.percentiles:
+            fields.append("pct_{:g}".format(100 * p))
+            values.append(format(value, ".6f"))
         return (
             "\n".join(
                 "{:8s} {}".format(f, v) 
-                for f, v in zip(self._fields, values) ) 
+                for f, v in zip(fields, values) ) 
             + "\n"
         )
     
 
-def get_stats(values, *, ddof=1):
-    if hasattr(values, "__len__"):
-        values = np.array(values, dtype="double")
+_PCT_FIELDS = {0: "min", 0.05: "pct_5", 0.5: "median", 0.95: "pct_95", 1: "max"}
+
+def _order_stat_indices(n, p, interpolation):
+    """
+    Returns the order statistic indices and weights for the `p` quantile.
+    """
+    pos = (n - 1) * p
+    lo = int(math.floor(pos))
+    hi = min(lo + 1, n - 1)
+    if interpolation == "nearest":
+        return ((int(round(pos)), 1.), )
+    elif interpolation == "lower":
+        return ((lo, 1.), )
+    elif interpolation == "higher":
+        return ((int(math.ceil(pos)), 1.), )
+    elif interpolation == "midpoint":
+        return ((lo, 1.), ) if pos == lo else ((lo, 0.5), (hi, 0.5))
+    elif interpolation == "linear":
+        frac = pos - lo
+        return ((lo, 1.), ) if frac == 0 else ((lo, 1 - frac), (hi, frac))
+    else:
+        raise ValueError("unknown interpolation: {}".format(interpolation))
+
+
+def get_stats(values, *, ddof=1, percentiles=(), interpolation="nearest",
+              overwrite=False):
+    """
+    Computes summary statistics.
+
+    Computes quantiles by selection with `np.partition`, in linear time,
+    rather than by sorting.
+
+    @param percentiles
+      Additional percentiles to compute, between 0 and 1.
+    @param interpolation
+      How to compute a quantile that falls between two values: "nearest",
+      "lower", "higher", "midpoint", or "linear".
+    @param overwrite
+      If true and `values` is a contiguous float64 array, reorders it in
+      place rather than copying it.
+    @rtype
+      `Stats`.
+    """
+    if (overwrite
+        and isinstance(values, np.ndarray)
+        and values.dtype == np.float64
+        and values.flags.c_contiguous):
+        values = values.reshape(-1)
+    elif hasattr(values, "__len__"):
+        values = np.array(values, dtype="double").reshape(-1)
     else:
         values = np.fromiter(values, dtype="double")
+    n = len(values)
+    if n == 0:
+        raise ValueError("no values")
 
-    values.sort()
-    percentile = lambda p: values[int(round((len(values) - 1) * p))]
+    ps = (0.05, 0.5, 0.95) + tuple(percentiles)
+    indices = [ _order_stat_indices(n, p, interpolation) for p in ps ]
+    kth = sorted({0, n - 1}.union( i for ix in indices for i, _ in ix ))
+    values.partition(kth)
+    quantiles = [ sum( values[i] * w for i, w in ix ) for ix in indices ]
 
     return Stats(
-        len(values),
+        n,
         values[0],
-        percentile(0.05),
+        quantiles[0],
         values.mean(),
-        percentile(0.50),
-        percentile(0.95),
+        quantiles[1],
+        quantiles[2],
         values[-1],
         values.std(ddof=ddof),
+        tuple(zip(percentiles, quantiles[3 :])),
     )
 
 
+def _group_stats(values, keys, weights=None, *, ddof=1, percentiles=()):
+    """
+    Computes per-group statistics as arrays.
+
+    @return
+      The sorted unique keys, a mapping from `Stats` field to array of values
+      by group, and an array of extra percentiles with one column per group.
+    """
+    values = np.asarray(values, dtype="double").reshape(-1)
+    keys = np.asarray(keys).reshape(-1)
+    if len(keys) != len(values):
+        raise ValueError("keys and values must have the same length")
+    if len(values) == 0:
+        raise ValueError("no values")
+    if keys.dtype.kind == "O":
+        # lexsort can't order objects; sort on integer codes instead.
+        keys, codes = np.unique(keys, return_inverse=True)
+        order = np.lexsort((values, codes))
+        starts = np.flatnonzero(np.diff(codes[order], prepend=-1))
+    else:
+        # A single sort orders by key, then by value within each group.
+        order = np.lexsort((values, keys))
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(
+            np.concatenate(([True], sorted_keys[1 :] != sorted_keys[: -1])))
+        keys = sorted_keys[starts]
+
+    values = values[order]
+    num = np.diff(np.append(starts, len(values)))
+    ends = starts + num
+    group = np.repeat(np.arange(len(starts)), num)
+
+    if weights is None:
+        total = num.astype("double")
+        mean = np.add.reduceat(values, starts) / total
+        dev = values - mean[group]
+        sq = np.add.reduceat(dev * dev, starts)
+
+        def quantile(p):
+            return values[starts + np.rint((num - 1) * p).astype(int)]
+
+    else:
+        weights = np.asarray(weights, dtype="double").reshape(-1)
+        if len(weights) != len(values):
+            raise ValueError("weights and values must have the same length")
+        weights = weights[order]
+        total = np.add.reduceat(weights, starts)
+        mean = np.add.reduceat(weights * values, starts) / total
+        dev = values - mean[group]
+        sq = np.add.reduceat(weights * dev * dev, starts)
+        cum = np.cumsum(weights)
+        base = cum[ends - 1] - total
+
+        def quantile(p):
+            # The first value at which the cumulative weight reaches p.
+            i = np.searchsorted(cum, base + p * total, side="left")
+            return values[np.clip(i, starts, ends - 1)]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        std_dev = np.sqrt(sq / (total - ddof))
+
+    fields = {
+        "num"       : num,
+        "min"       : values[starts],
+        "pct_5"     : quantile(0.05),
+        "mean"      : mean,
+        "median"    : quantile(0.5),
+        "pct_95"    : quantile(0.95),
+        "max"       : values[ends - 1],
+        "std_dev"   : std_dev,
+    }
+    pcts = np.array([ quantile(p) for p in percentiles ]).reshape(
+        len(percentiles), len(starts))
+    return keys, fields, pcts
+
+
+def group_stats(values, keys, weights=None, *, ddof=1, percentiles=()):
+    """
+    Computes summary statistics of `values` grouped by `keys`.
+
+    Computes all groups in a single vectorized pass: one sort orders values
+    by key and then by value, and reductions run over contiguous groups.
+    Quantiles use the "nearest" method, as `get_stats()` does by default.
+
+    @param keys
+      Group keys, the same length as `values`.
+    @param weights
+      Frequency weights, the same length as `values`, or none for equal
+      weights.  Weights apply to the mean, standard deviation, and quantiles;
+      `num` is always the number of values.  A weighted quantile is the
+      first value at which the cumulative weight reaches it.
+    @param percentiles
+      Additional percentiles to compute, between 0 and 1.
+    @return
+      A dict from group key to `Stats`, in key order.
+    """
+    keys, fields, pcts = _group_stats(
+        values, keys, weights, ddof=ddof, percentiles=percentiles)
+    columns = list(fields.values())
+    return {
+        key: Stats(
+            *( c[i] for c in columns ),
+            tuple(zip(percentiles, pcts[:, i]))
+        )
+        for i, key in enumerate(keys.tolist())
+    }
+
+
+#-------------------------------------------------------------------------------
+
+class QuantileSketch:
+    """
+    Mergeable streaming quantile sketch.
+
+    Implements the KLL sketch (Karnin, Lang, Liberty, 2016).  Items are held
+    in levels of compactors; an item at level `h` represents `2**h` inputs.
+    When a level exceeds its capacity, it is sorted and every other item,
+    starting at a random offset, is promoted to the next level.
+
+    Memory is about `3 * k` items, independent of the number of inputs.  The
+    rank error of a quantile is roughly `1.7 / k`, with high probability.
+
+    @param k
+      Capacity of the top level, which controls accuracy and memory.
+    @param seed
+      Seed for the random offsets, for reproducibility.
+    """
+
+    def __init__(self, k=200, *, seed=None):
+        if k < 8:
+            raise ValueError("k too small")
+        self.k = int(k)
+        self.num = 0
+        self.__levels = [np.empty(0)]
+        # Scalars added since the last compaction.
+        self.__pending = []
+        self.__rng = np.random.default_rng(seed)
+
+
+    def __repr__(self):
+        return "{}(k={}, num={})".format(
+            self.__class__.__name__, self.k, self.num)
+
+
+    def __capacity(self, h):
+        depth = len(self.__levels) - 1 - h
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+
+    def __flush(self):
+        if len(self.__pending) > 0:
+            self.__levels[0] = np.concatenate(
+                (self.__levels[0], np.array(self.__pending, dtype=float)))
+            self.__pending = []
+
+
+    def __compress(self):
+        self.__flush()
+        levels = self.__levels
+        h = 0
+        while h < len(levels):
+            if len(levels[h]) > self.__capacity(h):
+                if h + 1 == len(levels):
+                    levels.append(np.empty(0))
+                items = np.sort(levels[h])
+                # With an odd number, one item stays behind.
+                if len(items) % 2 == 1:
+                    levels[h], items = items[-1 :], items[: -1]
+                else:
+                    levels[h] = np.empty(0)
+                offset = self.__rng.integers(2)
+                levels[h + 1] = np.concatenate(
+                    (levels[h + 1], items[offset :: 2]))
+            h += 1
+
+
+    def add(self, value):
+        """
+        Adds a single value.
+        """
+        self.__pending.append(value)
+        self.num += 1
+        if len(self.__pending) >= self.k:
+            self.__compress()
+
+
+    def update(self, values):
+        """
+        Adds an array of values.
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        self.__flush()
+        self.__levels[0] = np.concatenate((self.__levels[0], values))
+        self.num += len(values)
+        self.__compress()
+
+
+    def merge(self, other):
+        """
+        Adds the values summarized by another sketch.
+        """
+        if other.k != self.k:
+            raise ValueError("can't merge sketches with different k")
+        self.__flush()
+        other.__flush()
+        for h, items in enumerate(other.__levels):
+            if h == len(self.__levels):
+                self.__levels.append(np.empty(0))
+            self.__levels[h] = np.concatenate((self.__levels[h], items))
+        self.num += other.num
+        self.__compress()
+
+
+    def quantiles(self, qs):
+        """
+        Returns estimated quantiles, for `qs` between 0 and 1.
+        """
+        if self.num == 0:
+            raise ValueError("no values")
+        self.__flush()
+        items = np.concatenate(self.__levels)
+        weights = np.concatenate([
+            np.full(len(l), 2. ** h) for h, l in enumerate(self.__levels) ])
+        order = np.argsort(items, kind="stable")
+        items = items[order]
+        cum = np.cumsum(weights[order])
+        ranks = np.asarray(qs, dtype=float) * cum[-1]
+        i = np.searchsorted(cum, ranks, side="left")
+        return items[np.minimum(i, len(items) - 1)]
+
+
+    def quantile(self, q):
+        """
+        Returns an estimated quantile, for `q` between 0 and 1.
+        """
+        return float(self.quantiles([q])[0])
+
+
+
+class StatsAccumulator:
+    """
+    Streaming, mergeable computation of `Stats`.
+
+    Computes the count, mean, and variance exactly, by Welford's method, and
+    the exact minimum and maximum.  Estimates quantiles with a
+    `QuantileSketch`.  Memory is constant.
+
+    Summaries computed separately, for instance by workers, may be combined
+    with `merge()`.
+
+    ```py
+    acc = StatsAccumulator()
+    for chunk in chunks:
+        acc.update(chunk)
+    print(acc.get_stats())
+    ```
+
+    @param k
+      Accuracy parameter for the quantile sketch; see `QuantileSketch`.
+    @param ddof
+      Delta degrees of freedom for the standard deviation.
+    """
+
+    def __init__(self, k=200, *, ddof=1, seed=None):
+        self.ddof = ddof
+        self.num = 0
+        self.mean = 0.
+        self.min = math.inf
+        self.max = -math.inf
+        # Sum of squared differences from the mean.
+        self.__m2 = 0.
+        self.sketch = QuantileSketch(k, seed=seed)
+
+
+    def __repr__(self):
+        return "{}(num={}, mean={})".format(
+            self.__class__.__name__, self.num, self.mean)
+
+
+    def __combine(self, num, mean, m2):
+        # Chan et al.'s parallel update.
+        total = self.num + num
+        delta = mean - self.mean
+        self.mean += delta * num / total
+        self.__m2 += m2 + delta * delta * self.num * num / total
+        self.num = total
+
+
+    def add(self, value):
+        """
+        Adds a single value.
+        """
+        value = float(value)
+        self.num += 1
+        delta = value - self.mean
+        self.mean += delta / self.num
+        self.__m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.sketch.add(value)
+
+
+    def update(self, values):
+        """
+        Adds an array or iterable of values.
+        """
+        if hasattr(values, "__len__"):
+            values = np.asarray(values, dtype="double").ravel()
+        else:
+            values = np.fromiter(values, dtype="double")
+        if len(values) == 0:
+            return
+        mean = values.mean()
+        self.__combine(len(values), mean, ((values - mean) ** 2).sum())
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.sketch.update(values)
+
+
+    def merge(self, other):
+        """
+        Adds the values summarized by another accumulator.
+        """
+        if other.num == 0:
+            return
+        self.__combine(other.num, other.mean, other.__m2)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+
+    @property
+    def variance(self):
+        n = self.num - self.ddof
+        return self.__m2 / n if n > 0 else math.nan
+
+
+    def get_stats(self, *, percentiles=()):
+        """
+        Returns `Stats` for the values so far.
+
+        @param percentiles
+          Additional percentiles to estimate, between 0 and 1.
+        """
+        if self.num == 0:
+            raise ValueError("no values")
+        pct_5, median, pct_95, *pcts = self.sketch.quantiles(
+            (0.05, 0.5, 0.95) + tuple(percentiles))
+        return Stats(
+            self.num,
+            self.min,
+            pct_5,
+            self.mean,
+            median,
+            pct_95,
+            self.max,
+            math.sqrt(self.variance),
+            tuple(zip(percentiles, pcts)),
+        )
+
+
+
+#-------------------------------------------------------------------------------
+
+class WindowedStats:
+    """
+    Statistics of values added over a recent sliding time window.
+
+    Values are collected in a ring of buckets, each a `StatsAccumulator`
+    covering `resolution` seconds.  As the clock advances, the oldest buckets
+    are discarded, so the window slides in steps of `resolution`.  Adding a
+    value costs O(1), amortized; a snapshot merges the buckets.
+
+    ```py
+    latency = WindowedStats(60)
+    with timing(record=latency):
+        handle(request)
+    p99 = latency.snapshot(percentiles=(0.99, )).percentile(0.99)
+    ```
+
+    @param window
+      Window length, in seconds.
+    @param resolution
+      Bucket length, in seconds.
+    @param k
+      Accuracy parameter for quantile sketches; see `QuantileSketch`.
+    @param clock
+      Function that returns the current time, in seconds.
+    """
+
+    def __init__(self, window=60, *, resolution=1, k=200, ddof=1,
+                 clock=time.monotonic):
+        if not 0 < resolution <= window:
+            raise ValueError("invalid resolution")
+        self.window = window
+        self.resolution = resolution
+        self.k = k
+        self.ddof = ddof
+        self.__clock = clock
+        self.__buckets = [None] * int(math.ceil(window / resolution))
+        # Index of the current bucket, in units of `resolution` since epoch.
+        self.__tick = None
+
+
+    def __repr__(self):
+        return "{}(window={}, resolution={})".format(
+            self.__class__.__name__, self.window, self.resolution)
+
+
+    def __advance(self):
+        """
+        Rotates the ring to the current time, and returns the current bucket.
+        """
+        tick = int(self.__clock() // self.resolution)
+        buckets = self.__buckets
+        n = len(buckets)
+        if tick != self.__tick:
+            # Discard buckets that have left the window.
+            start = tick - n
+            if self.__tick is not None:
+                start = max(start, self.__tick)
+            for t in range(start + 1, tick + 1):
+                buckets[t % n] = None
+            self.__tick = tick
+        bucket = buckets[tick % n]
+        if bucket is None:
+            bucket = StatsAccumulator(self.k, ddof=self.ddof)
+            buckets[tick % n] = bucket
+        return bucket
+
+
+    def add(self, value):
+        """
+        Adds a single value at the current time.
+        """
+        self.__advance().add(value)
+
+
+    def update(self, values):
+        """
+        Adds an array of values at the current time.
+        """
+        self.__advance().update(values)
+
+
+    def accumulate(self):
+        """
+        Returns a `StatsAccumulator` of the values in the window.
+        """
+        self.__advance()
+        acc = StatsAccumulator(self.k, ddof=self.ddof)
+        for bucket in self.__buckets:
+            if bucket is not None:
+                acc.merge(bucket)
+        return acc
+
+
+    @property
+    def num(self):
+        self.__advance()
+        return sum( b.num for b in self.__buckets if b is not None )
+
+
+    def snapshot(self, *, percentiles=()):
+        """
+        Returns `Stats` of the values in the window.
+
+        @raise ValueError
+          There are no values in the window.
+        """
+        return self.accumulate().get_stats(percentiles=percentiles)
+
+
+
+class DecayedStats:
+    """
+    Exponentially time-decayed mean and variance.
+
+    Each value is weighted by `0.5 ** (age / half_life)`, so recent values
+    dominate.  Adding a value costs O(1), and memory is constant.
+
+    Quantiles aren't tracked, so a snapshot's `min`, `max`, and percentiles
+    are NaN.  Its `num` is the total number of values added.
+
+    @param half_life
+      Time, in seconds, over which a value's weight halves.
+    @param clock
+      Function that returns the current time, in seconds.
+    """
+
+    def __init__(self, half_life=60, *, clock=time.monotonic):
+        if not half_life > 0:
+            raise ValueError("invalid half_life")
+        self.half_life = half_life
+        self.__clock = clock
+        self.__time = None
+        self.num = 0
+        self.mean = 0.
+        # Total decayed weight, and weighted sum of squared deviations.
+        self.__weight = 0.
+        self.__s = 0.
+
+
+    def __repr__(self):
+        return "{}(half_life={}, mean={})".format(
+            self.__class__.__name__, self.half_life, self.mean)
+
+
+    def __decay(self):
+        now = self.__clock()
+        if self.__time is not None and now > self.__time:
+            f = 0.5 ** ((now - self.__time) / self.half_life)
+            self.__weight *= f
+            self.__s *= f
+        self.__time = now
+
+
+    def add(self, value):
+        """
+        Adds a single value at the current time.
+        """
+        value = float(value)
+        self.__decay()
+        self.num += 1
+        # West's weighted incremental update.
+        self.__weight += 1
+        delta = value - self.mean
+        self.mean += delta / self.__weight
+        self.__s += delta * (value - self.mean)
+
+
+    @property
+    def weight(self):
+        """
+        The total decayed weight of values added, an effective count.
+        """
+        self.__decay()
+        return self.__weight
+
+
+    @property
+    def variance(self):
+        return self.__s / self.__weight if self.__weight > 0 else math.nan
+
+
+    def snapshot(self):
+        """
+        Returns `Stats` with the decayed mean and standard deviation.
+
+        @raise ValueError
+          No values have been added.
+        """
+        if self.num == 0:
+            raise ValueError("no values")
+        nan = math.nan
+        return Stats(
+            self.num, nan, nan, self.mean, nan, nan, nan,
+            math.sqrt(self.variance))
+
+
+
+#-------------------------------------------------------------------------------
+
+class HdrHistogram:
+    """
+    Histogram with log-linear buckets, in the style of HdrHistogram.
+
+    The range from `low` to `high` is divided into powers of two, each of
+    which is divided into equal linear sub-buckets, enough that a bucket's
+    width is no more than `10 ** -digits` of its values.  Values below `low`
+    are counted in a single bucket, and values above `high` in the top
+    bucket.  Counts are held in an int64 array, so merging histograms with
+    the same parameters is a single vector addition.
+
+    The count, sum, minimum, and maximum are exact.  Quantiles are accurate
+    to about `digits` significant digits.  Infinite and NaN values are
+    rejected.
+
+    ```py
+    hist = HdrHistogram(2)
+    hist.record(latencies)
+    print(hist.quantile(0.99))
+    print(hist.sparkline())
+    ```
+
+    @param digits
+      Number of significant decimal digits of precision.
+    @param low
+      Smallest value to resolve.
+    @param high
+      Largest value to resolve.
+    """
+
+    # Magic and version for `to_bytes()`.
+    __MAGIC = b"HDRH\x01"
+    __HEADER = struct.Struct("<5sBddqdddd")
+
+    def __init__(self, digits=2, *, low=1e-6, high=1e3):
+        if not 1 <= digits <= 5:
+            raise ValueError("digits must be between 1 and 5")
+        if not 0 < low < high:
+            raise ValueError("invalid range")
+        self.digits = int(digits)
+        self.low = float(low)
+        self.high = float(high)
+        # Number of linear sub-buckets per power of two.
+        self.__sub = 1 << int(math.ceil(math.log2(10 ** self.digits)))
+        self.__powers = int(math.ceil(math.log2(self.high / self.low)))
+        self.counts = np.zeros(1 + self.__powers * self.__sub, dtype=np.int64)
+        self.num = 0
+        self.sum = 0.
+        self.sum_sq = 0.
+        self.min = math.inf
+        self.max = -math.inf
+
+
+    def __repr__(self):
+        return "{}({}, low={!r}, high={!r}, num={})".format(
+            self.__class__.__name__, self.digits, self.low, self.high,
+            self.num)
+
+
+    def __indices(self, values):
+        # Write each value as low * 2**e * (1 + f), for 0 <= f < 1.
+        m, e = np.frexp(values / self.low)
+        sub = ((2 * m - 1) * self.__sub).astype(np.int64)
+        i = 1 + (e.astype(np.int64) - 1) * self.__sub + sub
+        # Above zero but below low, i is at most zero.  Zero and negative
+        # values have m <= 0, but not necessarily e <= 0.
+        i[m < 0.5] = 0
+        return np.clip(i, 0, len(self.counts) - 1)
+
+
+    def bounds(self, i):
+        """
+        Returns the lower and upper bounds of the values in bucket `i`.
+        """
+        if i == 0:
+            return 0., self.low
+        power, sub = divmod(i - 1, self.__sub)
+        scale = self.low * 2. ** power / self.__sub
+        return scale * (self.__sub + sub), scale * (self.__sub + sub + 1)
+
+
+    def add(self, value):
+        """
+        Records a single value.
+
+        @raise ValueError
+          The value is infinite or NaN.
+        """
+        value = float(value)
+        if not math.isfinite(value):
+            raise ValueError("can't record non-finite value: {}".format(value))
+        m, e = math.frexp(value / self.low)
+        if m < 0.5:
+            # Zero or negative.
+            i = 0
+        else:
+            i = max(0, min(
+                len(self.counts) - 1,
+                1 + (e - 1) * self.__sub + int((2 * m - 1) * self.__sub)))
+        self.counts[i] += 1
+        self.num += 1
+        self.sum += value
+        self.sum_sq += value * value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+
+    def record(self, values):
+        """
+        Records an array of values.
+
+        @raise ValueError
+          Any value is infinite or NaN; none are recorded.
+        """
+        values = np.asarray(values, dtype="double").ravel()
+        if len(values) == 0:
+            return
+        if not np.isfinite(values).all():
+            raise ValueError("can't record non-finite values")
+        self.counts += np.bincount(
+            self.__indices(values), minlength=len(self.counts))
+        self.num += len(values)
+        self.sum += float(values.sum())
+        self.sum_sq += float(np.dot(values, values))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+
+    def __check(self, other):
+        if (other.digits, other.low, other.high) != (
+                self.digits, self.low, self.high):
+            raise ValueError("histograms have different parameters")
+
+
+    def merge(self, other):
+        """
+        Adds the values recorded in another histogram with the same
+        parameters.
+        """
+        self.__check(other)
+        self.counts += other.counts
+        self.num += other.num
+        self.sum += other.sum
+        self.sum_sq += other.sum_sq
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+
+    def clear(self):
+        """
+        Removes all recorded values.
+        """
+        self.counts[:] = 0
+        self.num = 0
+        self.sum = self.sum_sq = 0.
+        self.min = math.inf
+        self.max = -math.inf
+
+
+    @property
+    def mean(self):
+        return self.sum / self.num if self.num > 0 else math.nan
+
+
+    def quantiles(self, qs):
+        """
+        Returns estimated quantiles, for `qs` between 0 and 1.
+
+        Each is the midpoint of the bucket containing it, clipped to the
+        exact minimum and maximum.
+        """
+        if self.num == 0:
+            raise ValueError("no values")
+        qs = np.asarray(qs, dtype=float)
+        cum = np.cumsum(self.counts)
+        i = np.searchsorted(cum, np.maximum(qs * self.num, 1), side="left")
+        lo, hi = np.vectorize(self.bounds, otypes=(float, float))(i)
+        return np.clip((lo + hi) / 2, self.min, self.max)
+
+
+    def quantile(self, q):
+        """
+        Returns an estimated quantile, for `q` between 0 and 1.
+        """
+        return float(self.quantiles([q])[0])
+
+
+    def get_stats(self, *, ddof=1, percentiles=()):
+        """
+        Returns `Stats` for the recorded values.
+        """
+        pct_5, median, pct_95, *pcts = self.quantiles(
+            (0.05, 0.5, 0.95) + tuple(percentiles))
+        n = self.num
+        var = (self.sum_sq - self.sum * self.mean) / (n - ddof) if n > ddof \
+              else math.nan
+        return Stats(
+            n,
+            self.min,
+            pct_5,
+            self.mean,
+            median,
+            pct_95,
+            self.max,
+            math.sqrt(max(0, var)),
+            tuple(zip(percentiles, pcts)),
+        )
+
+
+    def to_bytes(self):
+        """
+        Serializes the histogram to a compact binary form.
+        """
+        header = self.__HEADER.pack(
+            self.__MAGIC, self.digits, self.low, self.high, self.num,
+            self.sum, self.sum_sq, self.min, self.max)
+        # Mostly zero counts compress well.
+        return header + zlib.compress(self.counts.astype("<i8").tobytes())
+
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Deserializes a histogram from `to_bytes()`.
+        """
+        size = cls.__HEADER.size
+        magic, digits, low, high, num, sum, sum_sq, min, max = \
+            cls.__HEADER.unpack(data[: size])
+        if magic != cls.__MAGIC:
+            raise ValueError("not a serialized histogram")
+        hist = cls(digits, low=low, high=high)
+        counts = np.frombuffer(zlib.decompress(data[size :]), dtype="<i8")
+        if len(counts) != len(hist.counts):
+            raise ValueError("wrong number of buckets")
+        hist.counts[:] = counts
+        hist.num = num
+        hist.sum = sum
+        hist.sum_sq = sum_sq
+        hist.min = min
+        hist.max = max
+        return hist
+
+
+    def __occupied(self):
+        nz = np.flatnonzero(self.counts)
+        return (0, 0) if len(nz) == 0 else (nz[0], nz[-1] + 1)
+
+
+    def bins(self, num=20):
+        """
+        Combines buckets into about `num` bins, spanning the occupied buckets.
+
+        @return
+          A list of `(lo, hi, count)` for each bin.
+        """
+        start, end = self.__occupied()
+        edges = np.unique(np.linspace(start, end, num + 1).astype(int))
+        return [
+            (self.bounds(s)[0], self.bounds(e - 1)[1],
+             int(self.counts[s : e].sum()))
+            for s, e in zip(edges[: -1], edges[1 :])
+        ]
+
+
+    def sparkline(self, width=60):
+        """
+        Returns a one-line chart of the distribution over the occupied range,
+        on a log scale of value.
+        """
+        start, end = self.__occupied()
+        return chart.sparkline(self.counts[start : end].tolist(), width=width)
+
+
+    def bar_chart(self, num=20, *, width=40):
+        """
+        Returns lines of a bar chart of the distribution; see `bins()`.
+        """
+        bins = self.bins(num)
+        return chart.bar_chart(
+            [ "{:.3g}-{:.3g}".format(lo, hi) for lo, hi, _ in bins ],
+            [ c for _, _, c in bins ],
+            width=width, format="{:d}")
+
+
+
+#-------------------------------------------------------------------------------
+
+_STATISTICS = {
+    "mean"      : lambda x: x.mean(axis=-1),
+    "median"    : lambda x: np.median(x, axis=-1),
+}
+
+# Maximum number of resampled values to hold in memory at once.
+_BOOTSTRAP_BATCH = 1 << 22
+
+def _batch_size(n):
+    """
+    Returns the number of resamples of `n` values per batch.
+    """
+    return max(1, _BOOTSTRAP_BATCH // n)
+
+
+def _resample(values, resamples, rng, batch=None):
+    """
+    Generates batches of bootstrap resamples of `values`, each a 2D array
+    with one resample per row.
+
+    @param batch
+      The number of resamples per batch; by default, chosen from the number
+      of values.
+    """
+    n = len(values)
+    if batch is None:
+        batch = _batch_size(n)
+    for start in range(0, resamples, batch):
+        size = min(batch, resamples - start)
+        yield values[rng.integers(0, n, size=(size, n))]
+
+
+def bootstrap(values, statistic="mean", *, resamples=10000, seed=None):
+    """
+    Returns the bootstrap distribution of a statistic.
+
+    Resamples in batches of 2D arrays, so the statistic is vectorized over
+    resamples.
+
+    @param statistic
+      "mean", "median", or a function that reduces a 2D array along its last
+      axis.
+    @param seed
+      Random seed or `np.random.Generator`, for reproducible results.
+    @return
+      An array of the statistic for each resample.
+    """
+    values = np.asarray(values, dtype="double").reshape(-1)
+    if len(values) == 0:
+        raise ValueError("no values")
+    statistic = _STATISTICS.get(statistic, statistic)
+    rng = np.random.default_rng(seed)
+    return np.concatenate([
+        statistic(r) for r in _resample(values, resamples, rng) ])
+
+
+def bootstrap_interval(values, statistic="mean", *, confidence=0.95,
+                       resamples=10000, seed=None):
+    """
+    Returns a bootstrap percentile confidence interval for a statistic.
+
+    See `bootstrap()`.
+
+    @return
+      The low and high ends of the interval.
+    """
+    dist = bootstrap(values, statistic, resamples=resamples, seed=seed)
+    alpha = (1 - confidence) / 2
+    lo, hi = np.quantile(dist, (alpha, 1 - alpha))
+    return float(lo), float(hi)
+
+
+MannWhitney = namedtuple("MannWhitney", ("u", "p_value"))
+
+def mann_whitney(a, b):
+    """
+    Performs a two-sided Mann-Whitney U test.
+
+    Tests whether values in `a` tend to be larger or smaller than those in
+    `b`, without assuming normality.  Uses the normal approximation, with tie
+    and continuity corrections, which is adequate for more than about 20
+    values per sample.
+
+    @return
+      `MannWhitney` with the U statistic of `a` and the p-value.
+    """
+    a = np.asarray(a, dtype="double").reshape(-1)
+    b = np.asarray(b, dtype="double").reshape(-1)
+    na, nb = len(a), len(b)
+    if na == 0 or nb == 0:
+        raise ValueError("no values")
+
+    # Rank all values, averaging the ranks of ties.
+    values = np.concatenate((a, b))
+    order = np.argsort(values, kind="stable")
+    sorted_values = values[order]
+    starts = np.flatnonzero(
+        np.concatenate(([True], sorted_values[1 :] != sorted_values[: -1])))
+    counts = np.diff(np.append(starts, len(values)))
+    ranks = np.empty(len(values))
+    ranks[order] = np.repeat(starts + (counts + 1) / 2, counts)
+
+    u = ranks[: na].sum() - na * (na + 1) / 2
+    n = na + nb
+    ties = (counts ** 3 - counts).sum()
+    var = na * nb / 12 * ((n + 1) - ties / (n * (n - 1))) if n > 1 else 0
+    if var == 0:
+        return MannWhitney(float(u), 1.)
+    z = (abs(u - na * nb / 2) - 0.5) / math.sqrt(var)
+    p = 2 * (1 - NormalDist().cdf(max(z, 0)))
+    return MannWhitney(float(u), min(p, 1.))
+
+
+Speedup = namedtuple("Speedup", ("ratio", "low", "high", "p_value"))
+
+Speedup.__doc__ = """
+Speedup of one timing over another.
+
+`ratio` is the mean time of the first over the mean time of the second, so
+greater than one means the second is faster.  `low` and `high` bound a
+confidence interval for the ratio.  `p_value` is for the null hypothesis that
+the two have the same distribution.
+"""
+
+def _get_samples(timing):
+    if isinstance(timing, Stats):
+        return None
+    elif isinstance(timing, dict):
+        # A result from `aslib.timing.call_timer()`.
+        timing = timing["times"]
+    return np.asarray(timing, dtype="double").reshape(-1)
+
+
+def compare(a, b, *, confidence=0.95, resamples=10000, seed=None):
+    """
+    Compares two timings, and estimates the speedup of `b` over `a`.
+
+    Each of `a` and `b` may be an array of sample times, a result from
+    `aslib.timing.call_timer()`, or `Stats`.  Given samples for both, the
+    interval is a bootstrap interval for the ratio of means and the p-value
+    is from `mann_whitney()`.  Otherwise, both are computed from the means
+    and standard deviations with a normal approximation.
+
+    @rtype
+      `Speedup`.
+    """
+    sa, sb = _get_samples(a), _get_samples(b)
+    if sa is not None and sb is not None:
+        rng = np.random.default_rng(seed)
+        # Batch both samples alike, so that their batches line up.
+        batch = _batch_size(max(len(sa), len(sb)))
+        ratios = np.concatenate([
+            ra.mean(axis=1) / rb.mean(axis=1)
+            for ra, rb in zip(
+                _resample(sa, resamples, rng, batch),
+                _resample(sb, resamples, rng, batch))
+        ])
+        alpha = (1 - confidence) / 2
+        lo, hi = np.quantile(ratios, (alpha, 1 - alpha))
+        ratio = sa.mean() / sb.mean()
+        p_value = mann_whitney(sa, sb).p_value
+
+    else:
+        a = get_stats(sa) if sa is not None else a
+        b = get_stats(sb) if sb is not None else b
+        # Delta method for the standard error of the ratio of means.
+        ratio = a.mean / b.mean
+        var_a = a.std_dev ** 2 / a.num
+        var_b = b.std_dev ** 2 / b.num
+        se = ratio * math.sqrt(var_a / a.mean ** 2 + var_b / b.mean ** 2)
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        lo, hi = ratio - z * se, ratio + z * se
+        se_diff = math.sqrt(var_a + var_b)
+        p_value = (
+            2 * (1 - NormalDist().cdf(abs(a.mean - b.mean) / se_diff))
+            if se_diff > 0 else float(a.mean == b.mean)
+        )
+
+    return Speedup(float(ratio), float(lo), float(hi), float(p_value))
+
+
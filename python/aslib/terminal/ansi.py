@@ -27,6 +27,24 @@ def to_column(col):
     return csi(col + 1, "G")
 
 
+def cursor_up(lines=1):
+    """
+    Moves the cursor up `lines` lines.
+    """
+    return csi(lines, "A")
+
+
+def cursor_down(lines=1):
+    """
+    Moves the cursor down `lines` lines.
+    """
+    return csi(lines, "B")
+
+
+ERASE_LINE          = csi(2, "K")
+ERASE_TO_END        = csi(0, "K")
+
+
 def SGR(*codes):
     assert all( isinstance(c, int) for c in codes )
     return CSI + ";".join( str(c) for c in codes ) + "m"
@@ -0,0 +1,93 @@
+"""
+Simple text charts with Unicode block characters.
+"""
+
+#-------------------------------------------------------------------------------
+
+__all__ = [
+    "bar",
+    "bar_chart",
+    "resample",
+    "sparkline",
+]
+
+# Block characters, by eighths.
+SPARK_CHARS = " ▁▂▃▄▅▆▇█"
+BAR_CHARS   = " ▏▎▍▌▋▊▉█"
+
+#-------------------------------------------------------------------------------
+
+def resample(values, width):
+    """
+    Sums `values` into `width` groups of consecutive values.
+
+    If there are no more than `width` values, returns them unchanged.
+    """
+    values = list(values)
+    n = len(values)
+    if n <= width:
+        return values
+    bounds = [ i * n // width for i in range(width + 1) ]
+    return [ sum(values[s : e]) for s, e in zip(bounds[: -1], bounds[1 :]) ]
+
+
+def sparkline(values, *, width=None, top=None):
+    """
+    Returns a one-line chart of `values` as a string.
+
+      >>> sparkline([0, 1, 2, 4, 8, 4, 2, 1, 0])
+      ' ▁▂▄█▄▂▁ '
+
+    @param width
+      If not `None`, first sums values into this many groups.
+    @param top
+      The value drawn as a full block; by default, the largest value.
+    """
+    values = list(values) if width is None else resample(values, width)
+    if top is None:
+        top = max(values, default=0)
+    if not top > 0:
+        return SPARK_CHARS[0] * len(values)
+    levels = len(SPARK_CHARS) - 1
+    return "".join(
+        # Show any nonzero value with at least the lowest block.
+        SPARK_CHARS[
+            0 if v <= 0 else max(1, min(levels, int(round(v / top * levels))))]
+        for v in values
+    )
+
+
+def bar(fraction, width):
+    """
+    Returns a horizontal bar `fraction` of `width` columns long, with eighth
+    column resolution.
+    """
+    eighths = int(round(min(1, max(0, fraction)) * width * 8))
+    full, part = divmod(eighths, 8)
+    return ("█" * full + (BAR_CHARS[part] if part > 0 else "")).ljust(width)
+
+
+def bar_chart(labels, values, *, width=40, format="{:g}"):
+    """
+    Returns lines of a horizontal bar chart.
+
+    @param labels
+      A label for each bar.
+    @param width
+      Width of the longest bar.
+    @param format
+      Format for each value, shown after its bar.
+    """
+    labels = [ str(l) for l in labels ]
+    values = list(values)
+    label_width = max(( len(l) for l in labels ), default=0)
+    top = max(values, default=0)
+    return [
+        "{} │{} {}".format(
+            l.rjust(label_width),
+            bar(v / top if top > 0 else 0, width),
+            format.format(v))
+        for l, v in zip(labels, values)
+    ]
+
+
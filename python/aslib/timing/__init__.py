@@ -0,0 +1,955 @@
+"""
+Timing and measurement functionality.
+"""
+
+#-------------------------------------------------------------------------------
+
+import gc
+import itertools
+import math
+import operator
+import random
+from   time import perf_counter
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from   .. import metrics
+from   ..terminal import ansi
+
+#-------------------------------------------------------------------------------
+
+print_err = lambda *a, **k: print(*a, file=sys.stderr, **k)
+
+def _format_count(count):
+    if count < 1e+4:
+        return "{:.0f}".format(count)
+    for suffix in "kMGT":
+        count /= 1000
+        if count < 1000:
+            break
+    return "{:.{}f}{}".format(count, 1 if count < 100 else 0, suffix)
+
+
+def _format_eta(eta):
+    eta = int(math.ceil(eta))
+    return "{}:{:02d}:{:02d}".format(eta // 3600, eta // 60 % 60, eta % 60)
+
+
+class Progress:
+    """
+    Tracks and shows progress through a number of items.
+
+    Call `update()` as items complete.  It checks the time only every so many
+    items, choosing the number from the current rate so that checks are about
+    a quarter of `interval` apart.  Even so, each call costs about 100 ns;
+    in a tight loop, call `update(n)` every `n` items, or use `progress()`,
+    which does so.
+
+    Smooths the rate exponentially, with time constant `smoothing` seconds.
+    If `total` is known, shows a bar, percentage, and ETA.
+
+    ```py
+    with Progress(total=len(items), prefix="loading ") as bar:
+        for item in items:
+            load(item)
+            bar.update()
+    ```
+
+    @param total
+      The total number of items, or `None` if unknown.
+    @param file
+      File to which to print progress, or `None` to not print; see
+      `MultiProgress`.
+    @param in_place
+      If true, overwrite each line using a CR ('\r').
+    @param interval
+      Approximate time in seconds between updates.
+    @param width
+      Width of the bar in characters.
+    @param metric
+      If not `None`, the name of a counter in the default metrics registry to
+      which to add the count on close; see `aslib.metrics`.
+    """
+
+    # Slots make attribute access in `update()` faster.
+    __slots__ = (
+        "total", "prefix", "file", "in_place", "interval", "smoothing",
+        "width", "count", "rate", "start", "__counter", "__last_time",
+        "__last_print", "__last_count", "__next_check", "__rate_sum",
+        "__weight")
+
+    def __init__(self, total=None, *, prefix="", file=sys.stderr,
+                 in_place=True, interval=0.2, smoothing=2.0, width=30,
+                 metric=None):
+        self.total      = total
+        self.prefix     = prefix
+        self.file       = file
+        self.in_place   = bool(in_place)
+        self.interval   = interval
+        self.smoothing  = smoothing
+        self.width      = width
+        self.__counter  = None if metric is None else metrics.counter(metric)
+
+        self.count      = 0
+        self.rate       = None
+        self.start      = self.__last_time = self.__last_print = perf_counter()
+        self.__last_count = 0
+        self.__next_check = 1
+        self.__rate_sum = self.__weight = 0.
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def update(self, count=1):
+        """
+        Records that `count` more items are complete.
+        """
+        self.count += count
+        if self.count >= self.__next_check:
+            self._check()
+
+
+    def _check(self):
+        """
+        Updates the rate and prints, if due.
+
+        @return
+          The count at which to check next.
+        """
+        now = perf_counter()
+        self._sample(now)
+        if self.file is not None and now - self.__last_print >= self.interval:
+            self.__last_print = now
+            self.__print(now, final=False)
+        rate = self.rate or 0
+        next_check = self.count + max(1, int(rate * self.interval / 4))
+        self.__next_check = next_check
+        return next_check
+
+
+    def __smooth(self, now, count):
+        """
+        Returns the smoothed rate sum and weight at `now`, without updating.
+        """
+        rate_sum, weight = self.__rate_sum, self.__weight
+        elapsed = now - self.__last_time
+        if elapsed > 0:
+            rate = (count - self.__last_count) / elapsed
+            # Average exponentially, correcting for the bias toward zero of
+            # the initial value.
+            alpha = 1 - math.exp(-elapsed / self.smoothing)
+            rate_sum += alpha * (rate - rate_sum)
+            weight += alpha * (1 - weight)
+        return rate_sum, weight
+
+
+    def _sample(self, now):
+        """
+        Updates the smoothed rate.
+
+        Called only by the thread that calls `update()`.
+        """
+        if now - self.__last_time <= 0:
+            return
+        count = self.count
+        self.__rate_sum, self.__weight = self.__smooth(now, count)
+        self.rate = self.__rate_sum / self.__weight
+        self.__last_time = now
+        self.__last_count = count
+
+
+    def rate_at(self, now):
+        """
+        Returns the smoothed rate as of `now`, without updating state, so
+        another thread may call it; or `None` if unknown.
+        """
+        rate_sum, weight = self.__smooth(now, self.count)
+        return rate_sum / weight if weight > 0 else self.rate
+
+
+    @property
+    def elapsed(self):
+        return perf_counter() - self.start
+
+
+    @property
+    def eta(self):
+        """
+        Estimated time in seconds to completion, or `None` if unknown.
+        """
+        if self.total is None or not self.rate:
+            return None
+        else:
+            return max(0, self.total - self.count) / self.rate
+
+
+    def render(self, now=None):
+        """
+        Returns a one-line description of progress.
+        """
+        now = perf_counter() if now is None else now
+        # Read the count once, as another thread may be updating it.
+        count = self.count
+        rate = self.rate_at(now)
+        eta = (
+            None if self.total is None or not rate
+            else max(0, self.total - count) / rate
+        )
+        if rate is None:
+            rate = count / max(now - self.start, 1e-9)
+        rate = _format_count(rate) + "/s"
+        if self.total is None:
+            return "{}{} items  {}  {:.1f} s".format(
+                self.prefix, _format_count(count), rate, now - self.start)
+        else:
+            fraction = min(1, count / self.total) if self.total > 0 else 1
+            full = int(fraction * self.width)
+            return "{}[{}{}] {:5.1f}%  {}/{}  {}  ETA {}".format(
+                self.prefix, "█" * full, "·" * (self.width - full),
+                100 * fraction, _format_count(count),
+                _format_count(self.total), rate,
+                "?" if eta is None else _format_eta(eta))
+
+
+    def __print(self, now, final):
+        msg = self.render(now)
+        if self.in_place:
+            print("\r" + msg + "  ", end="\n" if final else "", file=self.file,
+                  flush=True)
+        else:
+            print(msg, file=self.file)
+
+
+    def close(self):
+        """
+        Prints final progress, and records the count.
+        """
+        now = perf_counter()
+        self._sample(now)
+        if self.file is not None:
+            self.__print(now, final=True)
+        if self.__counter is not None:
+            self.__counter.inc(self.count)
+
+
+
+class MultiProgress:
+    """
+    Shows several progress bars at once, for example for parallel workers.
+
+    A background thread redraws the bars every `interval` seconds, using ANSI
+    cursor controls to draw over them.  Workers only call `update()` on their
+    own bars; the drawing thread only reads them.
+
+    ```py
+    with MultiProgress() as bars:
+        for chunk in chunks:
+            pool.submit(work, chunk, bars.add(total=len(chunk)))
+    ```
+    """
+
+    def __init__(self, *, file=sys.stderr, interval=0.2):
+        self.file = file
+        self.interval = interval
+        self.__bars = []
+        self.__lines = 0
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__thread = None
+
+
+    def add(self, total=None, *, prefix="", **kw_args):
+        """
+        Adds and returns a new `Progress` bar.
+        """
+        bar = Progress(total, prefix=prefix, file=None, **kw_args)
+        with self.__lock:
+            self.__bars.append(bar)
+        return bar
+
+
+    def refresh(self):
+        """
+        Redraws all bars.
+        """
+        now = perf_counter()
+        with self.__lock:
+            lines = []
+            for bar in self.__bars:
+                lines.append(bar.render(now))
+            parts = []
+            if self.__lines > 0:
+                parts.append("\r" + ansi.cursor_up(self.__lines))
+            parts.extend( ansi.ERASE_LINE + l + "\n" for l in lines )
+            self.__lines = len(lines)
+            print("".join(parts), end="", file=self.file, flush=True)
+
+
+    def __run(self):
+        while not self.__stop.wait(self.interval):
+            self.refresh()
+
+
+    def __enter__(self):
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+        return self
+
+
+    def __exit__(self, *exc):
+        self.__stop.set()
+        self.__thread.join()
+        self.refresh()
+
+
+
+def progress(iterable, *, total=None, file=sys.stderr, in_place=True,
+             interval=0.2, prefix="", **kw_args):
+    """
+    Shows a progress bar while iterating over `iterable`.
+
+    Checks the time only every so many items, so the per-item overhead is
+    small.  See `Progress`.
+
+    @param total
+      The number of items, if `iterable` doesn't support `len()`.
+    @param in_place
+      If true, overwrite each line using a CR ('\r').
+    @param interval
+      Approximate time in seconds between updates.
+    """
+    if total is None:
+        try:
+            total = len(iterable)
+        except TypeError:
+            pass
+
+    bar = Progress(
+        total, prefix=prefix, file=file, in_place=in_place, interval=interval,
+        **kw_args)
+
+    # Count items in C, by zipping with a counter, and delegate iteration in
+    # chunks, so that the generator does no per-item work.  Reading the
+    # counter advances it, so subtract the number of reads.
+    counter = itertools.count()
+    items = map(operator.itemgetter(0), zip(iterable, counter))
+    reads = 0
+    with bar:
+        try:
+            count = 0
+            chunk = 1
+            while True:
+                yield from itertools.islice(items, chunk)
+                last, count = count, next(counter) - reads
+                reads += 1
+                if count - last < chunk:
+                    # Exhausted.
+                    break
+                bar.count = count
+                chunk = bar._check() - count
+        finally:
+            bar.count = next(counter) - reads
+
+
+#-------------------------------------------------------------------------------
+
+class timing:
+    """
+    Context manager that measures wall clock time between entry and exit.
+
+    @param metric
+      If not `None`, the name of a histogram in the default metrics registry
+      in which to record the elapsed time; see `aslib.metrics`.
+    @param record
+      If not `None`, an object whose `add()` method is called with the
+      elapsed time, for instance an `aslib.stats.WindowedStats`.
+    """
+
+    def __init__(self, *, metric=None, record=None):
+        self.__start = self.__end = self.__elapsed = None
+        self.__histogram = None if metric is None else metrics.histogram(metric)
+        self.__record = record
+
+
+    def __enter__(self):
+        self.__start = perf_counter()
+        return self
+        
+
+    def __exit__(self, *exc):
+        self.__end = perf_counter()
+        self.__elapsed = self.__end - self.__start
+        if self.__histogram is not None:
+            self.__histogram.observe(self.__elapsed)
+        if self.__record is not None:
+            self.__record.add(self.__elapsed)
+
+
+    @property
+    def start(self):
+        return self.__start
+
+
+    @property
+    def end(self):
+        return self.__end
+
+
+    @property
+    def elapsed(self):
+        return self.__elapsed
+
+
+
+def _format_elapsed(elapsed):
+    if elapsed < 1e-4:
+        return "{:.1f} µs".format(elapsed * 1e+6)
+    elif elapsed < 1e-3:
+        return "{:.0f} µs".format(elapsed * 1e+6)
+    elif elapsed < 1e-1:
+        return "{:.1f} ms".format(elapsed * 1e+3)
+    elif elapsed < 1:
+        return "{:.0f} ms".format(elapsed * 1e+3)
+    elif elapsed < 10:
+        return "{:.2f} s".format(elapsed)
+    elif elapsed < 100:
+        return "{:.1f} s".format(elapsed)
+    else:
+        return "{:.0f} s".format(elapsed)
+
+
+def _gc_collections():
+    return tuple( s["collections"] for s in gc.get_stats() )
+
+
+def _max_rss():
+    # ru_maxrss is in KiB on Linux but bytes on macOS.
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class resource_timing(timing):
+    """
+    Context manager that measures wall clock time and resource usage between
+    entry and exit.
+
+    Each measurement may be switched off, to reduce overhead; its result is
+    then `None`.
+
+    ```py
+    with resource_timing(alloc=True) as t:
+        run()
+    print(t)
+    ```
+
+    @param cpu
+      Measure process CPU time, user plus system, in `cpu_time`.
+    @param thread_cpu
+      Measure CPU time of the current thread in `thread_cpu_time`.
+    @param alloc
+      Trace Python memory allocation with `tracemalloc`, storing the peak
+      traced memory above that at entry in `alloc_peak`, and the net change
+      in `alloc_net`, in bytes.  This slows allocation substantially.
+    @param rss
+      Measure the increase in the process's maximum resident set size in
+      `max_rss_delta`, in bytes.  Not available on all platforms.
+    @param gc
+      Count garbage collections in `gc_collections`, a tuple of counts for
+      each generation.
+    """
+
+    def __init__(self, *, cpu=True, thread_cpu=True, alloc=False, rss=True,
+                 gc=True, metric=None, record=None):
+        super().__init__(metric=metric, record=record)
+        self.__cpu          = bool(cpu)
+        self.__thread_cpu   = bool(thread_cpu)
+        self.__alloc        = bool(alloc)
+        self.__rss          = bool(rss) and resource is not None
+        self.__gc           = bool(gc)
+
+        self.cpu_time = self.thread_cpu_time = None
+        self.alloc_peak = self.alloc_net = None
+        self.max_rss_delta = None
+        self.gc_collections = None
+
+
+    def __enter__(self):
+        if self.__gc:
+            self.__gc_start = _gc_collections()
+        if self.__rss:
+            self.__rss_start = _max_rss()
+        if self.__alloc:
+            self.__started_tracing = not tracemalloc.is_tracing()
+            if self.__started_tracing:
+                tracemalloc.start()
+            else:
+                tracemalloc.reset_peak()
+            self.__alloc_start, _ = tracemalloc.get_traced_memory()
+        if self.__thread_cpu:
+            self.__thread_cpu_start = time.thread_time()
+        if self.__cpu:
+            self.__cpu_start = time.process_time()
+        return super().__enter__()
+
+
+    def __exit__(self, *exc):
+        super().__exit__(*exc)
+        # Stop in the opposite order to starting.
+        if self.__cpu:
+            self.cpu_time = time.process_time() - self.__cpu_start
+        if self.__thread_cpu:
+            self.thread_cpu_time = time.thread_time() - self.__thread_cpu_start
+        if self.__alloc:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.__started_tracing:
+                tracemalloc.stop()
+            self.alloc_net = current - self.__alloc_start
+            self.alloc_peak = peak - self.__alloc_start
+        if self.__rss:
+            self.max_rss_delta = _max_rss() - self.__rss_start
+        if self.__gc:
+            self.gc_collections = tuple(
+                e - s for s, e in zip(self.__gc_start, _gc_collections()) )
+
+
+    @property
+    def cpu_fraction(self):
+        """
+        Process CPU time as a fraction of wall clock time.
+
+        Near or above 1 for CPU-bound work; near 0 for work that waits on I/O.
+        """
+        if self.cpu_time is None or not self.elapsed:
+            return None
+        else:
+            return self.cpu_time / self.elapsed
+
+
+    def __str__(self):
+        parts = []
+        if self.elapsed is not None:
+            parts.append("wall {}".format(_format_elapsed(self.elapsed)))
+        if self.cpu_time is not None:
+            parts.append("cpu {} ({:.0%})".format(
+                _format_elapsed(self.cpu_time), self.cpu_fraction or 0))
+        if self.thread_cpu_time is not None:
+            parts.append(
+                "thread cpu {}".format(_format_elapsed(self.thread_cpu_time)))
+        if self.alloc_peak is not None:
+            parts.append("alloc peak {} B net {} B".format(
+                self.alloc_peak, self.alloc_net))
+        if self.max_rss_delta is not None:
+            parts.append("max rss +{} B".format(self.max_rss_delta))
+        if self.gc_collections is not None:
+            parts.append("gc {}".format(
+                "/".join( str(c) for c in self.gc_collections )))
+        return ", ".join(parts)
+
+
+
+class timing_log(timing):
+    """
+    Context manager that logs elapsed wall clock time on exit.
+
+    @param print
+      Function to print log messages, or `None` to not log, for example if
+      `metric` is given.
+    @param metric
+      If not `None`, the name of a histogram in which to record the elapsed
+      time; see `timing`.
+    @param record
+      If not `None`, an object to which to add the elapsed time; see `timing`.
+    """
+
+    def __init__(self, name="timer", print=print_err, start=False, *,
+                 metric=None, record=None):
+        super().__init__(metric=metric, record=record)
+        self.__name = name
+        self.__print = print
+        self.__start = bool(start)
+
+
+    def __enter__(self):
+        if self.__start and self.__print is not None:
+            self.__print("{} starting".format(self.__name))
+        return super().__enter__()
+
+
+    def __exit__(self, *exc):
+        super().__exit__(*exc)
+        if self.__print is not None:
+            self.__print(
+                "{} {} in {}".format(
+                    self.__name, "done" if exc[0] is None else "exception",
+                    _format_elapsed(self.elapsed)))
+
+
+
+#-------------------------------------------------------------------------------
+# Spans
+
+class SpanNode:
+    """
+    Aggregated timings of a span at one position in the call tree.
+
+    Keeps a bounded reservoir sample of elapsed times, for percentiles.
+    """
+
+    RESERVOIR_SIZE = 256
+
+    __slots__ = ("name", "children", "count", "total", "child_total",
+                 "samples")
+
+    def __init__(self, name):
+        self.name           = name
+        self.children       = {}
+        self.count          = 0
+        self.total          = 0.
+        self.child_total    = 0.
+        self.samples        = []
+
+
+    def __repr__(self):
+        return "{}({!r}, count={}, total={})".format(
+            self.__class__.__name__, self.name, self.count, self.total)
+
+
+    def _add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        samples = self.samples
+        if len(samples) < self.RESERVOIR_SIZE:
+            samples.append(elapsed)
+        else:
+            i = int(random.random() * self.count)
+            if i < self.RESERVOIR_SIZE:
+                samples[i] = elapsed
+
+
+    @property
+    def self_time(self):
+        """
+        Total time not spent in child spans.
+
+        While the span is open, its children's time may not yet be included in
+        its total; this is then zero rather than negative.
+        """
+        return max(0., self.total - self.child_total)
+
+
+    def percentile(self, p):
+        """
+        Returns an estimate of the `p` percentile of elapsed time, where `p` is
+        between 0 and 1.
+        """
+        if len(self.samples) == 0:
+            return None
+        samples = sorted(self.samples)
+        return samples[int(round((len(samples) - 1) * p))]
+
+
+    def _merge(self, other):
+        samples = self.samples + other.samples
+        if len(samples) > self.RESERVOIR_SIZE:
+            # Each reservoir stands for `count` spans, so draw from each in
+            # proportion to its count, as if sampling the spans themselves.
+            n0, n1 = self.count, other.count
+            k = 0
+            for _ in range(self.RESERVOIR_SIZE):
+                if random.random() * (n0 + n1) < n0:
+                    k += 1
+                    n0 -= 1
+                else:
+                    n1 -= 1
+            samples = (
+                random.sample(self.samples, k)
+                + random.sample(other.samples, self.RESERVOIR_SIZE - k)
+            )
+        self.samples = samples
+        self.count          += other.count
+        self.total          += other.total
+        self.child_total    += other.child_total
+        for name, child in other.children.items():
+            try:
+                node = self.children[name]
+            except KeyError:
+                node = self.children[name] = SpanNode(name)
+            node._merge(child)
+
+
+    def walk(self, path=()):
+        """
+        Generates `(path, node)` for this node and its descendants, where
+        `path` is the tuple of span names.
+        """
+        if self.name is not None:
+            path = path + (self.name, )
+            yield path, self
+        for child in self.children.values():
+            yield from child.walk(path)
+
+
+
+class _NullSpan:
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        pass
+
+
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+
+    __slots__ = ("name", "node", "parent", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+
+    def __enter__(self):
+        try:
+            stack = _span_local.stack
+        except AttributeError:
+            stack = _init_span_thread()
+        parent = stack[-1]
+        try:
+            node = parent.children[self.name]
+        except KeyError:
+            node = parent.children[self.name] = SpanNode(self.name)
+        stack.append(node)
+        self.node = node
+        self.parent = parent
+        self.start = perf_counter()
+        return self
+
+
+    def __exit__(self, *exc):
+        elapsed = perf_counter() - self.start
+        _span_local.stack.pop()
+        self.node._add(elapsed)
+        self.parent.child_total += elapsed
+
+
+
+_spans_enabled = False
+_span_local = threading.local()
+# Span trees of threads, as pairs of thread and root.
+_span_roots = []
+# Spans of threads that have exited, merged.
+_span_exited = SpanNode(None)
+_span_lock = threading.Lock()
+
+def _prune_span_threads():
+    """
+    Folds the trees of exited threads into `_span_exited`, so that memory
+    doesn't grow with the number of threads ever created.
+
+    Must be called with `_span_lock` held.
+    """
+    live = []
+    for thread, root in _span_roots:
+        if thread.is_alive():
+            live.append((thread, root))
+        else:
+            _span_exited._merge(root)
+    _span_roots[:] = live
+
+
+def _init_span_thread():
+    root = SpanNode(None)
+    stack = _span_local.stack = [root]
+    with _span_lock:
+        _prune_span_threads()
+        _span_roots.append((threading.current_thread(), root))
+    return stack
+
+
+def span(name):
+    """
+    Returns a context manager that times a span of code.
+
+    Spans nest, building a call tree for each thread.  Each node aggregates
+    the count, total time, self time excluding child spans, and a sample of
+    elapsed times for percentiles.  Spans are recorded only when enabled with
+    `enable_spans()`; otherwise, this returns a shared no-op context manager.
+
+    ```py
+    enable_spans()
+    with span("load"):
+        with span("parse"):
+            ...
+    print_span_tree()
+    ```
+    """
+    return _Span(name) if _spans_enabled else _NULL_SPAN
+
+
+def enable_spans(enabled=True):
+    """
+    Enables or disables recording of spans.
+    """
+    global _spans_enabled
+    _spans_enabled = bool(enabled)
+
+
+def reset_spans():
+    """
+    Discards recorded spans for all threads.
+
+    Spans that are open in any thread when this is called are discarded too.
+    """
+    global _span_exited
+    with _span_lock:
+        _prune_span_threads()
+        for _, root in _span_roots:
+            root.children.clear()
+            root.child_total = 0.
+        _span_exited = SpanNode(None)
+
+
+def get_span_tree():
+    """
+    Returns the recorded spans for all threads, merged into a single tree.
+
+    @return
+      The root `SpanNode`, whose name is `None`.
+    """
+    root = SpanNode(None)
+    with _span_lock:
+        _prune_span_threads()
+        roots = [_span_exited] + [ r for _, r in _span_roots ]
+        for thread_root in roots:
+            root._merge(thread_root)
+    return root
+
+
+def dump_folded(file=sys.stdout, *, root=None):
+    """
+    Writes spans in folded stacks format, as used by flame graph tools.
+
+    Each line contains the semicolon-separated span names, a space, and the
+    self time in microseconds.
+    """
+    root = get_span_tree() if root is None else root
+    for path, node in root.walk():
+        time = int(round(node.self_time * 1e+6))
+        if time > 0:
+            print("{} {}".format(";".join(path), time), file=file)
+
+
+def print_span_tree(file=sys.stdout, *, root=None):
+    """
+    Prints spans as an indented tree, with counts, times, and percentiles.
+    """
+    root = get_span_tree() if root is None else root
+    nodes = list(root.walk())
+    width = max(
+        [ 2 * (len(p) - 1) + len(str(p[-1])) for p, _ in nodes ] + [4])
+    fmt = "{:" + str(width) + "s} {:>8s} {:>9s} {:>9s} {:>9s} {:>9s}"
+    print(fmt.format("span", "count", "total", "self", "p50", "p99"),
+          file=file)
+    for path, node in nodes:
+        # A span still open has no samples, and so no percentiles.
+        p50, p99 = node.percentile(0.5), node.percentile(0.99)
+        print(fmt.format(
+            "  " * (len(path) - 1) + str(path[-1]),
+            str(node.count),
+            _format_elapsed(node.total),
+            _format_elapsed(node.self_time),
+            "" if p50 is None else _format_elapsed(p50),
+            "" if p99 is None else _format_elapsed(p99),
+        ), file=file)
+
+
+#-------------------------------------------------------------------------------
+
+MSEC = 1e-3
+USEC = 1e-6
+NSEC = 1e-6
+
+def _time1(fn, args, kw_args):
+    start = perf_counter()
+    fn(*args, **kw_args)
+    return perf_counter() - start
+
+
+def _time(count, fn, args, kw_args):
+    if count == 1:
+        return _time1(fn, args, kw_args)
+
+    start = perf_counter()
+    for _ in range(count):
+        fn(*args, **kw_args)
+    return perf_counter() - start
+
+
+def _estimate_count(min_time, fn, args, kw_args):
+    """
+    Estimates the time to invoke `fn(*args, **kw_args)`.
+    """
+    count = 1
+    elapsed = _time1(fn, args, kw_args)
+
+    while elapsed < min_time:
+        count *= 10
+        elapsed = _time(count, fn, args, kw_args)
+
+    return count
+
+
+def call_timer(samples=100, *, warm_up=1, min_sample_time=10 * USEC, quantile=0.1):
+    """
+    Creates a function call timer.
+
+    The timer calls a function repeatedly and returns a dict of timing
+    results.  "time" is the given quantile of the per-call times of the
+    samples, and "times" the per-call time of each sample, in order.
+    """
+    def time(fn, *args, **kw_args):
+        # Do some un-timed warm up calls.
+        for _ in range(warm_up):
+            fn(*args, **kw_args)
+
+        # Choose the count so the sample time isn't too small.
+        count = _estimate_count(min_sample_time, fn, args, kw_args)
+
+        # Sample the timing.
+        times = [ 
+            _time(count, fn, args, kw_args) / count 
+            for _ in range(samples) ]
+
+        # Use the given quantile as the timing result.
+        time = sorted(times)[int(len(times) * quantile)]
+
+        return {
+            "name"      : fn.__name__,
+            "time"      : time,
+            "samples"   : samples,
+            "count"     : count,
+            "times"     : times,
+        }
+
+    return time
+
+
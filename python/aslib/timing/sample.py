@@ -0,0 +1,61 @@
+"""
+Runs a Python script or module under the sampling profiler.
+
+Usage:
+
+    python -m aslib.timing.sample [ -i SECS ] [ -o PATH ] SCRIPT [ ARG ... ]
+    python -m aslib.timing.sample [ -i SECS ] [ -o PATH ] -m MODULE [ ARG ... ]
+
+Writes samples in folded stacks format to PATH on exit, and also whenever the
+process receives SIGUSR2.  See `aslib.timing.sampler`.
+"""
+
+#-------------------------------------------------------------------------------
+
+import argparse
+import os
+import runpy
+import signal
+import sys
+
+from   .sampler import start
+
+#-------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m aslib.timing.sample",
+        description="Runs a Python program under the sampling profiler.")
+    parser.add_argument(
+        "-i", "--interval", metavar="SECS", type=float, default=0.01,
+        help="sample every SECS seconds [def: 0.01]")
+    parser.add_argument(
+        "-o", "--output", metavar="PATH", default="stacks.folded",
+        help="write folded stacks to PATH [def: stacks.folded]")
+    parser.add_argument(
+        "-m", dest="module", action="store_true",
+        help="run TARGET as a module")
+    parser.add_argument(
+        "target", metavar="TARGET",
+        help="script path, or module name with -m")
+    parser.add_argument(
+        "args", metavar="ARG", nargs=argparse.REMAINDER,
+        help="arguments to TARGET")
+    args = parser.parse_args()
+
+    sys.argv = [args.target] + args.args
+    signum = getattr(signal, "SIGUSR2", None)
+    start(args.interval, path=args.output, signum=signum)
+    if args.module:
+        runpy.run_module(args.target, run_name="__main__", alter_sys=True)
+    else:
+        # Like `python script.py`, put the script's directory first on the
+        # path, so its sibling modules import.
+        sys.path.insert(0, os.path.dirname(os.path.abspath(args.target)))
+        runpy.run_path(args.target, run_name="__main__")
+
+
+if __name__ == "__main__":
+    main()
+
+
@@ -0,0 +1,236 @@
+"""
+Statistical sampling profiler for long-running processes.
+
+A background thread samples the stacks of all other threads at a fixed
+interval, and aggregates them in a trie.  The samples can be written in
+folded stacks format, as used by flame graph tools, from code, on a signal,
+or at exit.
+
+```py
+from aslib.timing import sampler
+
+sampler.start(path="/tmp/myapp.folded", signum=signal.SIGUSR2)
+```
+
+Or, to profile a script, see `aslib.timing.sample`.
+
+Since threads are sampled regardless of what they are doing, the profile
+shows wall clock time, including time spent waiting.
+"""
+
+#-------------------------------------------------------------------------------
+
+import atexit
+import os
+import signal
+import sys
+import threading
+
+__all__ = [
+    "Sampler",
+    "start",
+]
+
+#-------------------------------------------------------------------------------
+
+# Trie node indices.
+_COUNT      = 0
+_CHILDREN   = 1
+
+def _new_node():
+    return [0, {}]
+
+
+class Sampler:
+    """
+    Samples thread stacks periodically in a background thread.
+
+    @param interval
+      Time between samples, in seconds.
+    @param path
+      If not `None`, path to which `dump()` writes by default.
+    """
+
+    def __init__(self, interval=0.01, *, path=None):
+        self.interval = interval
+        self.path = path
+        self.samples = 0
+        # Trie of frame labels, from outermost to innermost frame.  Each node
+        # is a list of the count of samples ending there, and children.
+        self.__root = _new_node()
+        self.__labels = {}
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__thread = None
+
+
+    def __enter__(self):
+        self.start()
+        return self
+
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+    def __label(self, code):
+        try:
+            return self.__labels[code]
+        except KeyError:
+            name = getattr(code, "co_qualname", code.co_name)
+            label = self.__labels[code] = "{} ({}:{})".format(
+                name, os.path.basename(code.co_filename), code.co_firstlineno)
+            return label
+
+
+    def sample(self):
+        """
+        Takes a sample of the stacks of all threads other than the current.
+        """
+        this = threading.get_ident()
+        frames = sys._current_frames()
+        label = self.__label
+        with self.__lock:
+            for ident, frame in frames.items():
+                if ident == this:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                node = self.__root
+                for code in reversed(stack):
+                    children = node[_CHILDREN]
+                    l = label(code)
+                    try:
+                        node = children[l]
+                    except KeyError:
+                        node = children[l] = _new_node()
+                node[_COUNT] += 1
+            self.samples += 1
+        del frames
+
+
+    def __run(self):
+        while not self.__stop.wait(self.interval):
+            self.sample()
+
+
+    def start(self):
+        """
+        Starts sampling in a background thread.
+        """
+        if self.__thread is not None:
+            raise RuntimeError("sampler already started")
+        self.__stop.clear()
+        self.__thread = threading.Thread(
+            target=self.__run, name="aslib-sampler", daemon=True)
+        self.__thread.start()
+
+
+    def stop(self):
+        """
+        Stops sampling.
+        """
+        if self.__thread is not None:
+            self.__stop.set()
+            self.__thread.join()
+            self.__thread = None
+
+
+    def clear(self):
+        """
+        Discards samples taken so far.
+        """
+        with self.__lock:
+            self.__root = _new_node()
+            self.samples = 0
+
+
+    def write_folded(self, file=sys.stdout):
+        """
+        Writes samples in folded stacks format.
+
+        Each line contains the semicolon-separated frame labels, outermost
+        first, a space, and the number of samples.
+        """
+        with self.__lock:
+            lines = []
+            stack = [((), self.__root)]
+            while len(stack) > 0:
+                path, (count, children) = stack.pop()
+                if count > 0:
+                    lines.append("{} {}".format(";".join(path), count))
+                stack.extend( (path + (l, ), c) for l, c in children.items() )
+        for line in sorted(lines):
+            print(line, file=file)
+
+
+    def dump(self, path=None):
+        """
+        Writes samples in folded stacks format to `path`, or the default
+        path.
+        """
+        path = self.path if path is None else path
+        if path is None:
+            raise ValueError("no path")
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "w") as file:
+            self.write_folded(file)
+        os.replace(tmp_path, path)
+
+
+    def install_signal(self, signum=None):
+        """
+        Installs a handler that dumps samples when the process receives
+        `signum`.
+
+        Must be called from the main thread.
+
+        @param signum
+          The signal number; by default, SIGUSR2, where available.
+        """
+        if signum is None:
+            signum = getattr(signal, "SIGUSR2", None)
+            if signum is None:
+                raise ValueError("no SIGUSR2 on this platform; give signum")
+        # Dump from a separate thread, since the signal may arrive while the
+        # main thread holds the lock.
+        dump = lambda: threading.Thread(target=self.dump).start()
+        signal.signal(signum, lambda signum, frame: dump())
+
+
+    def dump_at_exit(self):
+        """
+        Registers to dump samples when the process exits.
+        """
+        def dump():
+            self.stop()
+            self.dump()
+
+        atexit.register(dump)
+
+
+
+def start(interval=0.01, *, path=None, signum=None, at_exit=True):
+    """
+    Creates and starts a sampler.
+
+    @param path
+      Path to which to dump samples in folded stacks format.
+    @param signum
+      If not `None`, a signal on which to dump samples.
+    @param at_exit
+      If true and `path` is given, dump samples when the process exits.
+    @rtype
+      `Sampler`.
+    """
+    sampler = Sampler(interval, path=path)
+    if signum is not None:
+        sampler.install_signal(signum)
+    if at_exit and path is not None:
+        sampler.dump_at_exit()
+    sampler.start()
+    return sampler
+
+